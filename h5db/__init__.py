@@ -1,5 +1,6 @@
-from memodb.h5db.core import H5DB, H5DBObject, H5AccessMode
-from memodb.h5db.core import Scalar, Vector, Matrix, List, DataFrame, Object, ObjectList, Blob
+from memodb.h5db.core import H5DB, H5DBReader, H5DBObject, H5AccessMode, ObjectCache, ObjectProxy, StorageMode, \
+    DataFrameAppender, Field, Query, StorageProfile, WriterService, WriterClient
+from memodb.h5db.core import Scalar, Vector, Matrix, List, DataFrame, Object, ObjectList, Blob, BufferedBlob
 
 
 __version_info__ = ['0', '1']
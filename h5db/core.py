@@ -3,12 +3,143 @@ import h5py
 import pandas
 import numpy as np
 from enum import Enum
+import collections
+import contextlib
+import copy
+import functools
+import hashlib
+import multiprocessing
+import multiprocessing.connection
+import numbers
+import operator
+import os
 import pickle
+import queue
+import sys
+import threading
+import time
+import urllib.parse
 
 ### DEFAULT TYPES
 
 UNINITIALIZED_SCALAR = 'UninitializedScalar'
 REF_DTYPE = h5py.special_dtype(ref=h5py.Reference)
+REGIONREF_DTYPE = h5py.special_dtype(ref=h5py.RegionReference)
+# target size of automatically sized chunks in bytes
+CHUNK_BYTES = 64 * 1024
+# options of h5py.Group.create_dataset that require a chunked layout
+FILTER_OPTIONS = ('compression', 'compression_opts', 'shuffle', 'fletcher32', 'scaleoffset')
+# root group of the bookkeeping data of H5DB (indexes, ...)
+META_GROUP = '__h5db__'
+# the H5DB whose method is running in the current thread, see _session
+_active = threading.local()
+
+
+def _decode(value):
+    # h5py returns variable length strings as bytes
+    if isinstance(value, bytes):
+        return value.decode()
+    return value
+
+
+def _reference_dtype(refs):
+    # objects stored in groups are referenced by object references, rows of object tables by region references
+    region_refs = [isinstance(ref, h5py.RegionReference) for ref in refs]
+    if not any(region_refs):
+        return REF_DTYPE
+    if all(region_refs):
+        return REGIONREF_DTYPE
+    raise Exception('Objects stored in tables and objects stored in groups cannot be referenced by the same list')
+
+
+def _active_db():
+    # the H5DB that saves or loads the object whose references are written or read
+    db = getattr(_active, 'db', None)
+    if db is None:
+        raise Exception('Objects can only be saved and loaded by the methods of a H5DB')
+    return db
+
+
+def _session(method):
+    # makes the H5DB the active database of the current thread while the method runs, so that Object and ObjectList
+    # save and resolve references with it
+    @functools.wraps(method)
+    def session(self, *args, **kwargs):
+        outer = getattr(_active, 'db', None)
+        _active.db = self
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            _active.db = outer
+    return session
+
+
+def _reference_keys(dataset):
+    # reads the references of a dataset as raw bytes, object references to the same object have equal bytes
+    reference_type = dataset.id.get_type()
+    raw = np.empty(dataset.shape, dtype='V%d' % (reference_type.get_size()))
+    if raw.size:
+        dataset.id.read(h5py.h5s.ALL, h5py.h5s.ALL, raw, mtype=reference_type)
+    return [value.tobytes() for value in raw.flat]
+
+
+def auto_chunks(shape, dtype, resizable=False):
+    """
+    Returns a chunk shape of about CHUNK_BYTES bytes: the trailing dimensions are kept whole (and only halved if a
+    single row exceeds the target), the first dimension takes as many rows as fit.
+    """
+    itemsize = max(1, np.dtype(dtype).itemsize)
+    trailing = [max(1, int(size)) for size in shape[1:]]
+    while trailing and int(np.prod(trailing)) * itemsize > CHUNK_BYTES and max(trailing) > 1:
+        largest = trailing.index(max(trailing))
+        trailing[largest] = (trailing[largest] + 1) // 2
+    rows = max(1, CHUNK_BYTES // (int(np.prod(trailing)) * itemsize))
+    if not resizable:
+        rows = min(rows, max(1, int(shape[0])))
+    return (rows,) + tuple(trailing)
+
+
+def _create_dataset(parent_group, name, data, options, maxshape=None):
+    # applies the storage options (compression, shuffle, fletcher32, chunks, ...) of an attribute to a new dataset
+    data = np.asarray(data)
+    kwargs = dict(options)
+    if maxshape is not None:
+        kwargs['maxshape'] = maxshape
+    chunked = maxshape is not None or any(kwargs.get(option) for option in FILTER_OPTIONS) or kwargs.get('chunks')
+    if data.ndim == 0 or (data.size == 0 and maxshape is None):
+        # scalar and empty fixed size datasets cannot be chunked
+        kwargs = {}
+    elif chunked and kwargs.get('chunks') in (None, True):
+        kwargs['chunks'] = auto_chunks(data.shape, data.dtype, resizable=maxshape is not None)
+    return parent_group.create_dataset(name, data=data, **kwargs)
+
+
+def _memory_map(dataset):
+    # maps a contiguous, unfiltered dataset of the file read only into memory, returns None for all other datasets
+    if dataset.chunks is not None or dataset.size == 0 or dataset.dtype.hasobject or dataset.file.driver != 'sec2':
+        return None
+    if dataset.file.mode != 'r':
+        # the data must have reached the file
+        dataset.file.flush()
+    offset = dataset.id.get_offset()
+    if offset is None:
+        return None
+    return np.memmap(dataset.file.filename, mode='r', dtype=dataset.dtype, shape=dataset.shape, offset=offset)
+
+
+def _overwrite(dataset, data):
+    # writes data into an existing dataset of the same dtype if its shape can take it, returns success
+    if dataset.dtype.hasobject or data.dtype != dataset.dtype:
+        return False
+    if data.shape != dataset.shape:
+        if data.ndim != dataset.ndim or dataset.maxshape is None or data.ndim == 0:
+            return False
+        if any(m is not None and n > m for n, m in zip(data.shape, dataset.maxshape)):
+            return False
+        dataset.resize(data.shape)
+    dataset[...] = data
+    return True
+
 
 class Scalar():
     def save(parent_group, attr_name, value):
@@ -24,40 +155,178 @@ class Scalar():
 
 
 class Vector():
-    def save(parent_group, attr_name, value):
-        parent_group[attr_name] = value
+    def save(parent_group, attr_name, value, **options):
+        _create_dataset(parent_group, attr_name, value, options)
 
     def read(parent_group, attr_name):
         return parent_group[attr_name].value
 
 
 class Matrix():
-    def save(parent_group, attr_name, values):
-        dataset = parent_group.create_dataset(attr_name, data=values)
-
-    def read(parent_group, attr_name):
+    def save(parent_group, attr_name, values, **options):
+        dataset = _create_dataset(parent_group, attr_name, values, options)
+
+    def read(parent_group, attr_name, mmap=False):
+        # with mmap=True contiguous, unfiltered matrices are returned as read only numpy.memmap, so that the pages are
+        # shared with all other processes reading the file
+        if mmap:
+            values = _memory_map(parent_group[attr_name])
+            if values is not None:
+                return values
         return parent_group[attr_name][...]
 
+    def content(values):
+        # the bytes that identify a stored matrix, for the deduplication of equal matrices
+        values = np.asarray(values)
+        if values.dtype.hasobject:
+            return None
+        return [values.dtype.str.encode(), repr(values.shape).encode(),
+                np.ascontiguousarray(values).reshape(-1).view(np.uint8)]
+
 
 class List():
-    def save(parent_group, attr_name, value):
-        dataset = parent_group.create_dataset(attr_name, data=np.array(value, dtype=np.string_))
+    def save(parent_group, attr_name, value, **options):
+        dataset = _create_dataset(parent_group, attr_name, np.array(value, dtype=np.string_), options)
 
     def read(parent_group, attr_name):
         return [item.decode() for item in parent_group[attr_name].value]
 
 
 class DataFrame():
-    def save(parent_group, attr_name, dataframe):
-        dataset = parent_group.create_dataset(attr_name, data=dataframe.values)
-        dataset.attrs['index'] = np.array(dataframe.index.tolist(), dtype='S')
-        dataset.attrs['columns'] = np.array(dataframe.columns.tolist(), dtype='S')
-
-    def read(parent_group, attr_name):
-        dataset = parent_group[attr_name]
-        index = DataFrame.make_index(dataset.attrs['index'])
-        columns = DataFrame.make_index(dataset.attrs['columns'])
-        return pandas.DataFrame(data=dataset[...], index=index, columns=columns)
+    """
+    DataFrames are stored as a group with one resizable dataset per column, named by the position of the column, which
+    keeps the dtype of each column. Frames that have been stored as a single matrix dataset by earlier versions can
+    still be read.
+    """
+    def content(dataframe):
+        if not isinstance(dataframe, pandas.DataFrame):
+            return None
+        return [pickle.dumps(dataframe, protocol=4)]
+
+    def save(parent_group, attr_name, dataframe, **options):
+        group = parent_group.create_group(attr_name)
+        group.attrs['columns'] = np.array(dataframe.columns.tolist(), dtype='S')
+        for position in range(dataframe.shape[1]):
+            data, attrs = DataFrame.encode_column(dataframe.iloc[:, position])
+            DataFrame.create_column(group, str(position), data, attrs, options)
+        if isinstance(dataframe.index, pandas.MultiIndex):
+            # one column per level, which keeps the dtypes of the levels
+            index = group.create_group('index')
+            for level in range(dataframe.index.nlevels):
+                DataFrame.save_index(index, str(level), dataframe.index.get_level_values(level))
+        elif not DataFrame.has_default_index(dataframe):
+            DataFrame.save_index(group, 'index', dataframe.index)
+
+    def read(parent_group, attr_name, columns=None, start=0):
+        """
+        Reads the frame, or only the given list of *columns* of it, from row *start* on. In files opened in SWMR read
+        mode the rows that have been appended by the writer so far are read.
+        """
+        group = parent_group[attr_name]
+        if isinstance(group, h5py.Dataset):
+            return DataFrame.read_matrix(group, columns)[start:]
+        all_columns = DataFrame.make_index(group.attrs['columns'])
+        if columns is None:
+            positions = list(range(len(all_columns)))
+        else:
+            positions = [all_columns.get_loc(column) for column in columns]
+        datasets = {name: group[name] for name in group}
+        if group.file.swmr_mode:
+            for dataset in datasets.values():
+                if isinstance(dataset, h5py.Dataset):
+                    dataset.refresh()
+        frame = pandas.DataFrame({i: DataFrame.decode_column(datasets[str(position)], start)
+                                  for i, position in enumerate(positions)})
+        frame.columns = all_columns[positions]
+
+        if 'index' in datasets:
+            index = datasets['index']
+            if isinstance(index, h5py.Group):
+                frame.index = pandas.MultiIndex.from_arrays(
+                    [DataFrame.read_index(index[str(level)], start) for level in range(len(index))])
+            else:
+                frame.index = DataFrame.read_index(index, start)
+        elif len(all_columns) > 0:
+            length = datasets['0'].shape[0]
+            frame.index = pandas.RangeIndex(min(start, length), length)
+        return frame
+
+    def read_matrix(dataset, columns=None):
+        all_columns = DataFrame.make_index(dataset.attrs['columns'])
+        if columns is None:
+            data = dataset[...]
+            columns = all_columns
+        else:
+            # h5py selects columns in increasing order only
+            positions = [all_columns.get_loc(column) for column in columns]
+            selection = sorted(set(positions))
+            data = dataset[:, selection][:, [selection.index(position) for position in positions]]
+            columns = all_columns[positions]
+        if 'index' in dataset.attrs:
+            index = DataFrame.make_index(dataset.attrs['index'])
+        else:
+            index = pandas.RangeIndex(data.shape[0])
+        return pandas.DataFrame(data=data, index=index, columns=columns)
+
+    def create_column(group, name, data, attrs, options={}):
+        # rows can be appended later on, see DataFrameAppender
+        dataset = _create_dataset(group, name, data, options, maxshape=(None,))
+        for key, value in attrs.items():
+            dataset.attrs[key] = value
+        return dataset
+
+    def save_index(group, name, index):
+        data, attrs = DataFrame.encode_column(index.to_series())
+        if isinstance(index.name, str):
+            attrs['name'] = index.name
+        DataFrame.create_column(group, name, data, attrs)
+
+    def read_index(dataset, start=0):
+        return pandas.Index(DataFrame.decode_column(dataset, start), name=_decode(dataset.attrs.get('name')))
+
+    def encode_column(values):
+        # returns the data to store and the attributes needed to restore the dtype of the column
+        dtype = values.dtype
+        if isinstance(dtype, np.dtype) and dtype.kind in 'biufc':
+            return values.to_numpy(), {}
+        if isinstance(dtype, np.dtype) and dtype.kind in 'mM':
+            return values.to_numpy().view('int64'), {'dtype': str(dtype)}
+        if isinstance(dtype, pandas.CategoricalDtype):
+            return DataFrame.encode_strings(values.astype(str)), {'encoding': 'str', 'dtype': 'category'}
+        cells = values.to_numpy(dtype=object)
+        if all(isinstance(cell, str) for cell in cells):
+            return DataFrame.encode_strings(cells), {'encoding': 'str'}
+        return DataFrame.encode_pickles(cells), {'encoding': 'pickle'}
+
+    def encode_strings(cells):
+        return np.array(cells, dtype=h5py.special_dtype(vlen=str))
+
+    def encode_pickles(cells):
+        data = np.empty(len(cells), dtype=h5py.special_dtype(vlen=np.uint8))
+        for i, cell in enumerate(cells):
+            data[i] = np.frombuffer(pickle.dumps(cell), dtype=np.uint8)
+        return data
+
+    def decode_column(dataset, start=0):
+        data = dataset[start:]
+        encoding = dataset.attrs.get('encoding')
+        dtype = _decode(dataset.attrs.get('dtype'))
+        if encoding == 'str':
+            data = np.array([_decode(cell) for cell in data], dtype=object)
+        elif encoding == 'pickle':
+            cells = np.empty(len(data), dtype=object)
+            for i, cell in enumerate(data):
+                cells[i] = pickle.loads(cell.tobytes())
+            data = cells
+        elif dtype is not None:
+            data = data.view(dtype)
+        if dtype == 'category':
+            return pandas.Categorical(data)
+        return data
+
+    def has_default_index(dataframe):
+        # a 0..n-1 index is not stored
+        return dataframe.index.equals(pandas.RangeIndex(len(dataframe.index)))
 
     def make_index(raw):
         index = raw.astype('U')
@@ -67,14 +336,91 @@ class DataFrame():
             return pandas.Index(index)
 
 
+class DataFrameAppender():
+    """
+    Appends rows to a stored DataFrame. Rows are collected in an in-memory buffer of *buffer_size* rows, which is
+    written as one block to the resizable column datasets of the frame whenever it is full, followed by a flush of the
+    file. Use H5DB.open_appender to create an appender.
+    """
+
+    def __init__(self, group, buffer_size=1024):
+        if not isinstance(group, h5py.Group) or 'index' in group:
+            raise Exception('Rows cannot be appended to DataFrame %s' % (group.name))
+        self._group = group
+        self.columns = [_decode(column) for column in group.attrs['columns']]
+        self._datasets = [group[str(position)] for position in range(len(self.columns))]
+        self._buffers = [np.empty(buffer_size, dtype=dataset.dtype) for dataset in self._datasets]
+        self._encoders = [DataFrameAppender.cell_encoder(dataset) for dataset in self._datasets]
+        self._buffer_size = buffer_size
+        self._buffered = 0
+        self.closed = False
+
+    def append(self, row):
+        """
+        Appends a row, given as mapping from column names to values or as sequence in column order.
+        """
+        if self.closed:
+            raise Exception('DataFrameAppender of %s has been closed' % (self._group.name))
+        if hasattr(row, 'keys'):
+            row = [row[column] for column in self.columns]
+        for buffer, encoder, value in zip(self._buffers, self._encoders, row):
+            buffer[self._buffered] = value if encoder is None else encoder(value)
+        self._buffered += 1
+        if self._buffered == self._buffer_size:
+            self.flush()
+
+    def extend(self, rows):
+        """
+        Appends a block of rows, given as DataFrame with the columns of the stored frame.
+        """
+        self.flush()
+        for dataset, column in zip(self._datasets, self.columns):
+            data, _ = DataFrame.encode_column(rows[column])
+            DataFrameAppender.write(dataset, data)
+        self._group.file.flush()
+
+    def flush(self):
+        if self._buffered:
+            for dataset, buffer in zip(self._datasets, self._buffers):
+                DataFrameAppender.write(dataset, buffer[:self._buffered])
+            self._buffered = 0
+        self._group.file.flush()
+
+    def close(self):
+        if not self.closed:
+            self.flush()
+            self.closed = True
+
+    def __len__(self):
+        if not self._datasets:
+            return 0
+        return self._datasets[0].shape[0] + self._buffered
+
+    def write(dataset, data):
+        start = dataset.shape[0]
+        dataset.resize((start + len(data),))
+        dataset[start:] = data
+
+    def cell_encoder(dataset):
+        encoding = dataset.attrs.get('encoding')
+        dtype = _decode(dataset.attrs.get('dtype'))
+        if encoding == 'pickle':
+            return lambda value: np.frombuffer(pickle.dumps(value), dtype=np.uint8)
+        if encoding == 'str':
+            return str
+        if dtype is not None:
+            return lambda value: np.array(value, dtype=dtype).view('int64')
+        return None
+
+
 class Object:
 
     def save(parent_group, attr_name, object):
         # save the object in the group of its own class
-        ref = Object._h5db.save_object(object)
+        ref = _active_db().save_object(object)
 
         # save a object reference in the target group
-        ref_dataset = parent_group.create_dataset(attr_name, data=np.array(ref, dtype=REF_DTYPE))
+        ref_dataset = parent_group.create_dataset(attr_name, data=np.array(ref, dtype=_reference_dtype([ref])))
 
     def read(parent_group, attr_name):
         # read reference dataset
@@ -83,11 +429,11 @@ class Object:
         return Object._resolve_reference(ref_dataset)
 
     def _resolve_reference(reference):
-        h5obj = Object._h5db.resolve_ref(reference)
-        fullpath = h5obj.name
-        clazz_name, ID = fullpath[1:].split('/')
-        clazz = Object._h5db.resolve_class_name(clazz_name)
-        obj = Object._h5db.load_object(clazz, ID)
+        db = _active_db()
+        clazz, ID = db.resolve_reference(reference)
+        if db._lazy_loading:
+            return db.proxy(clazz, ID)
+        obj = db.load_object(clazz, ID)
         return obj
 
 
@@ -97,17 +443,14 @@ class ObjectList:
         # save each object
         refs = []
         for object in objects:
-            ref = Object._h5db.save_object(object)
+            ref = _active_db().save_object(object)
             refs.append(ref)
         # save list of references
-        ref_dataset = parent_group.create_dataset(attr_name, data=np.array(refs, dtype=REF_DTYPE))
+        ref_dataset = parent_group.create_dataset(attr_name, data=np.array(refs, dtype=_reference_dtype(refs)))
 
     def read(parent_group, attr_name):
-        # read reference dataset
-        ref_dataset = parent_group[attr_name].value
-        # resolve all references
-        objects = [Object._resolve_reference(ref) for ref in ref_dataset]
-        return objects
+        # resolve all references of the dataset at once
+        return _active_db().resolve_objects(parent_group[attr_name])
 
 
 class Reference():
@@ -124,36 +467,878 @@ class Reference():
 
 class Blob():
 
-    def save(parent_group, attr_name, object):
+    def content(object):
+        return [pickle.dumps(object)]
+
+    def save(parent_group, attr_name, object, **options):
         pickled_obj = pickle.dumps(object)
-        dataset = parent_group.create_dataset(attr_name, data=np.void(pickled_obj))
+        if options:
+            # an opaque scalar cannot be filtered, so the pickle is stored as byte array instead
+            dataset = _create_dataset(parent_group, attr_name, np.frombuffer(pickled_obj, dtype=np.uint8), options)
+        else:
+            dataset = parent_group.create_dataset(attr_name, data=np.void(pickled_obj))
         #     dataset.attrs['memo_dataset_type'] = DatasetType.metamodel.value
 
     def read(parent_group, attr_name):
-        pickled_obj = parent_group[attr_name].value
+        dataset = parent_group[attr_name]
+        if dataset.dtype == np.uint8:
+            return pickle.loads(dataset[...].tobytes())
+        pickled_obj = dataset.value
         result = pickle.loads(pickled_obj)
         return result
 
 
+class BufferedBlob():
+    """
+    Blob that is pickled with protocol 5. Large buffers, e.g. the data of numpy arrays, are not copied into the pickle
+    stream but stored as datasets of their own, which can be compressed by storage options and memory mapped on read.
+    """
+    # buffers below this size stay in the pickle stream
+    MIN_BUFFER_BYTES = 64 * 1024
+
+    def content(object):
+        buffers = []
+        pickled_obj = pickle.dumps(object, protocol=5, buffer_callback=buffers.append)
+        return [pickled_obj] + [buffer.raw() for buffer in buffers]
+
+    def save(parent_group, attr_name, object, **options):
+        buffers = []
+
+        def out_of_band(buffer):
+            if buffer.raw().nbytes < BufferedBlob.MIN_BUFFER_BYTES:
+                return True
+            buffers.append(buffer)
+            return False
+
+        pickled_obj = pickle.dumps(object, protocol=5, buffer_callback=out_of_band)
+        group = parent_group.create_group(attr_name)
+        group.create_dataset('pickle', data=np.frombuffer(pickled_obj, dtype=np.uint8))
+        group.attrs['buffers'] = len(buffers)
+        for i, buffer in enumerate(buffers):
+            _create_dataset(group, str(i), np.frombuffer(buffer.raw(), dtype=np.uint8), options)
+
+    def read(parent_group, attr_name, mmap=False):
+        group = parent_group[attr_name]
+        if isinstance(group, h5py.Dataset):
+            # written as Blob
+            return Blob.read(parent_group, attr_name)
+        buffers = []
+        for i in range(group.attrs['buffers']):
+            buffer = _memory_map(group[str(i)]) if mmap else None
+            buffers.append(buffer if buffer is not None else group[str(i)][...])
+        return pickle.loads(group['pickle'][...].tobytes(), buffers=buffers)
+
+
+class ObjectProxy():
+    """
+    Stands in for a referenced object that has not been loaded yet. The object is loaded on the first access of one of
+    its attributes, all attribute reads and writes are then forwarded to it. The class and the ID of the object are
+    known without loading it, so isinstance checks and saving a parent object do not trigger a load.
+    """
+    __slots__ = ('_proxy_db', '_proxy_class', '_proxy_ID', '_proxy_target')
+
+    def __init__(self, h5db, clazz, ID):
+        object.__setattr__(self, '_proxy_db', h5db)
+        object.__setattr__(self, '_proxy_class', clazz)
+        object.__setattr__(self, '_proxy_ID', ID)
+        object.__setattr__(self, '_proxy_target', None)
+
+    @property
+    def __class__(self):
+        return self._proxy_class
+
+    @property
+    def ID(self):
+        return self._proxy_ID
+
+    def _proxy_resolve(self):
+        target = self._proxy_target
+        if target is None:
+            # referenced objects of the target are loaded lazily as well
+            target = self._proxy_db.load_object(self._proxy_class, self._proxy_ID, lazy=True)
+            object.__setattr__(self, '_proxy_target', target)
+        return target
+
+    def __getattr__(self, name):
+        return getattr(self._proxy_resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._proxy_resolve(), name, value)
+
+    def __len__(self):
+        return len(self._proxy_resolve())
+
+    def __repr__(self):
+        if self._proxy_target is None:
+            return '%s [ID=%s, not loaded]' % (self._proxy_class.__name__, self._proxy_ID)
+        return repr(self._proxy_target)
+
+
+class StorageMode(Enum):
+    """
+    GROUP   every object is stored in a group of its own (default)
+    TABLE   all objects of a class are stored as rows of one table, for classes that only have Scalar attributes
+
+    A class selects its storage mode with the class attribute h5db_storage.
+    """
+    GROUP = 'group'
+    TABLE = 'table'
+
+
+class ObjectTable():
+    """
+    Stores the objects of a class with StorageMode.TABLE as rows of the resizable compound dataset 'table' in the class
+    group. The IDs are kept in the dataset 'ids' in the same row order, objects are referenced by region references into
+    this dataset. A column is stored as bool, int64, float64 or string as long as all of its values allow that (int
+    and float values as float64) and as pickled bytes otherwise; the table is rewritten once a column has to be
+    widened. Deleted rows keep an empty ID.
+    """
+    KIND_DTYPES = {
+        'b': np.dtype('bool'),
+        'i': np.dtype('int64'),
+        'f': np.dtype('float64'),
+        's': h5py.special_dtype(vlen=str),
+        'o': h5py.special_dtype(vlen=np.uint8),
+    }
+
+    def __init__(self, class_group, mapper):
+        self._class_group = class_group
+        self._mapper = mapper
+        # IDs by row and rows by ID, read from the file on first use
+        self._ids = None
+        self._rows = None
+
+    def _load_ids(self):
+        if self._ids is None:
+            if 'ids' in self._class_group:
+                self._ids = [_decode(ID) for ID in self._class_group['ids'][...]]
+            else:
+                self._ids = []
+            self._rows = {ID: row for row, ID in enumerate(self._ids) if ID}
+
+    def __contains__(self, ID):
+        self._load_ids()
+        return ID in self._rows
+
+    def __len__(self):
+        self._load_ids()
+        return len(self._rows)
+
+    def ids(self):
+        self._load_ids()
+        return [ID for ID in self._ids if ID]
+
+    def id_at(self, row):
+        self._load_ids()
+        return self._ids[row]
+
+    def reference(self, ID):
+        self._load_ids()
+        row = self._rows[ID]
+        return self._class_group['ids'].regionref[row:row + 1]
+
+    def kinds(self):
+        if 'table' not in self._class_group:
+            return {}
+        dtype = self._class_group['table'].dtype
+        return {name: ObjectTable.kind_of_dtype(dtype.fields[name][0]) for name in dtype.names}
+
+    def write(self, objects):
+        """
+        Appends rows for new objects and overwrites the rows of objects that are already stored.
+        """
+        self._load_ids()
+        attributes = self._mapper.attributes
+        values = {}
+        kinds = self.kinds()
+        new_kinds = {}
+        for attr_name in attributes:
+            values[attr_name] = [ObjectTable.normalize(getattr(obj, attr_name)) for obj in objects]
+            kind = kinds.get(attr_name)
+            for value in values[attr_name]:
+                kind = ObjectTable.widen(kind, ObjectTable.kind_of(value))
+            new_kinds[attr_name] = kind or 'f'
+
+        if 'table' not in self._class_group:
+            dtype = ObjectTable.make_dtype(attributes, new_kinds)
+            self._class_group.create_dataset('table', shape=(0,), maxshape=(None,), dtype=dtype, chunks=True)
+            self._class_group.create_dataset('ids', shape=(0,), maxshape=(None,), dtype=ObjectTable.KIND_DTYPES['s'],
+                                             chunks=True)
+        elif new_kinds != kinds:
+            self._rebuild(new_kinds)
+
+        table = self._class_group['table']
+        data = np.empty(len(objects), dtype=table.dtype)
+        for attr_name in attributes:
+            column = data[attr_name]
+            for i, value in enumerate(values[attr_name]):
+                column[i] = ObjectTable.encode(new_kinds[attr_name], value)
+
+        rows = []
+        new_rows = []
+        for obj in objects:
+            row = self._rows.get(obj.ID)
+            if row is None:
+                row = len(self._ids)
+                self._ids.append(obj.ID)
+                self._rows[obj.ID] = row
+                new_rows.append(row)
+            rows.append(row)
+
+        ids = self._class_group['ids']
+        if len(self._ids) > table.shape[0]:
+            table.resize((len(self._ids),))
+            ids.resize((len(self._ids),))
+        ObjectTable.write_rows(table, rows, data)
+        ObjectTable.write_rows(ids, new_rows, np.array([self._ids[row] for row in new_rows], dtype=object))
+
+    def read(self, IDs=None):
+        """
+        Reads the rows of the given IDs (or of all stored objects) and returns the IDs and a dict of attribute values
+        lists. All rows are read with a single read.
+        """
+        self._load_ids()
+        if 'table' not in self._class_group:
+            return [], {attr_name: [] for attr_name in self._mapper.attributes}
+        if IDs is None:
+            rows = [row for row, ID in enumerate(self._ids) if ID]
+            data = self._class_group['table'][...][rows]
+            IDs = [self._ids[row] for row in rows]
+        else:
+            # read the range of rows spanned by the IDs at once
+            rows = np.array([self._rows[ID] for ID in IDs], dtype=np.int64)
+            first = int(rows.min()) if len(rows) else 0
+            last = int(rows.max()) + 1 if len(rows) else 0
+            data = self._class_group['table'][first:last][rows - first]
+        kinds = self.kinds()
+        columns = {attr_name: ObjectTable.decode(kinds[attr_name], data[attr_name]) for attr_name in kinds}
+        return list(IDs), columns
+
+    def delete(self, ID):
+        self._load_ids()
+        row = self._rows.pop(ID)
+        self._ids[row] = ''
+        self._class_group['ids'][row] = ''
+
+    def _rebuild(self, new_kinds):
+        # rewrite the table with wider column types, the ids dataset (and thereby all references) stays untouched
+        kinds = self.kinds()
+        old_data = self._class_group['table'][...]
+        data = np.empty(len(old_data), dtype=ObjectTable.make_dtype(self._mapper.attributes, new_kinds))
+        for attr_name in self._mapper.attributes:
+            if attr_name not in kinds:
+                column_values = [ObjectTable.normalize(None)] * len(old_data)
+            elif kinds[attr_name] == new_kinds[attr_name]:
+                data[attr_name] = old_data[attr_name]
+                continue
+            else:
+                column_values = ObjectTable.decode(kinds[attr_name], old_data[attr_name])
+            column = data[attr_name]
+            for i, value in enumerate(column_values):
+                column[i] = ObjectTable.encode(new_kinds[attr_name], value)
+        del self._class_group['table']
+        self._class_group.create_dataset('table', data=data, maxshape=(None,), chunks=True)
+
+    def write_rows(dataset, rows, data):
+        # write runs of consecutive rows with one write each
+        start = 0
+        while start < len(rows):
+            end = start + 1
+            while end < len(rows) and rows[end] == rows[end - 1] + 1:
+                end += 1
+            dataset[rows[start]:rows[end - 1] + 1] = data[start:end]
+            start = end
+
+    def make_dtype(attributes, kinds):
+        return np.dtype([(attr_name, ObjectTable.KIND_DTYPES[kinds[attr_name]]) for attr_name in attributes])
+
+    def normalize(value):
+        # same conventions as Scalar.save
+        if value is Scalar:
+            return UNINITIALIZED_SCALAR
+        if value is None:
+            return np.nan
+        return value
+
+    def kind_of(value):
+        if isinstance(value, (bool, np.bool_)):
+            return 'b'
+        if isinstance(value, (int, np.integer)):
+            return 'i'
+        if isinstance(value, (float, np.floating)):
+            return 'f'
+        if isinstance(value, str):
+            return 's'
+        return 'o'
+
+    def kind_of_dtype(dtype):
+        vlen = h5py.check_dtype(vlen=dtype)
+        if vlen is None:
+            return dtype.kind
+        return 'o' if vlen == np.uint8 else 's'
+
+    def widen(kind, other):
+        if kind is None or kind == other:
+            return other
+        if {kind, other} == {'i', 'f'}:
+            return 'f'
+        return 'o'
+
+    def encode(kind, value):
+        if kind == 'o':
+            return np.frombuffer(pickle.dumps(value), dtype=np.uint8)
+        return value
+
+    def decode(kind, column):
+        if kind == 's':
+            return [_decode(value) for value in column]
+        if kind == 'o':
+            return [pickle.loads(value.tobytes()) for value in column]
+        return list(column)
+
+
+class AttributeIndex():
+    """
+    Persistent secondary index of a Scalar attribute. The index is a group with one subgroup per distinct value, which
+    holds a soft link to each object with this value, named by the ID of the object. Finding the objects with a value
+    is a lookup in the B-tree of the index group and does not depend on the number of stored objects.
+    """
+
+    def __init__(self, group, class_name):
+        self._group = group
+        self._class_name = class_name
+
+    def add(self, ID, value):
+        key = AttributeIndex.key(value)
+        entries = self._group.get(key)
+        if entries is None:
+            entries = self._group.create_group(key)
+        entries[ID] = h5py.SoftLink('/%s/%s' % (self._class_name, ID))
+
+    def remove(self, ID, value):
+        key = AttributeIndex.key(value)
+        entries = self._group.get(key)
+        if entries is not None and ID in entries:
+            del entries[ID]
+            if len(entries) == 0:
+                del self._group[key]
+
+    def find(self, value):
+        entries = self._group.get(AttributeIndex.key(value))
+        if entries is None:
+            return []
+        return list(entries)
+
+    def key(value):
+        # equal values as read from and written to the file map to the same group name
+        value = _decode(ObjectTable.normalize(value))
+        if isinstance(value, str):
+            key = 's:' + value
+        elif isinstance(value, (bool, np.bool_)):
+            key = 'b:%d' % (value)
+        elif isinstance(value, (int, np.integer)):
+            key = 'n:%d' % (value)
+        elif isinstance(value, (float, np.floating)):
+            key = 'n:%d' % (value) if float(value).is_integer() else 'n:' + repr(float(value))
+        else:
+            key = 'r:' + repr(np.asarray(value).tolist())
+        return urllib.parse.quote(key, safe=':')
+
+
+class Catalog():
+    """
+    Resizable compound dataset with one row per stored object: the name of its class, its ID, its address and the size
+    of its payload in bytes. The address of an object stored as group is the value of object references to it, table
+    rows have the address 0. The catalog is read with a single read when the file is opened. Rows of deleted objects
+    keep an empty class name. The names of the classes whose objects have been catalogued are kept in the attribute
+    'classes'.
+    """
+    DTYPE = np.dtype([('class', h5py.special_dtype(vlen=str)), ('ID', h5py.special_dtype(vlen=str)),
+                      ('address', np.uint64), ('size', np.int64)])
+
+    def __init__(self, dataset):
+        self._dataset = dataset
+        self._rows = {}
+        self._ids = {}
+        self._addresses = {}
+        self._sizes = {}
+        self.classes = set(_decode(class_name) for class_name in dataset.attrs.get('classes', []))
+        for row, (class_name, ID, address, size) in enumerate(dataset[...].tolist()):
+            class_name = _decode(class_name)
+            if class_name:
+                self._register(row, class_name, _decode(ID), int(address), int(size))
+
+    def _register(self, row, class_name, ID, address, size):
+        self._rows[(class_name, ID)] = row
+        self._ids.setdefault(class_name, {})[ID] = None
+        self._sizes[(class_name, ID)] = size
+        if address:
+            self._addresses[address] = (class_name, ID)
+
+    def add(self, entries):
+        """
+        Appends rows for a list of (class name, ID, address, size) entries.
+        """
+        if not entries:
+            return
+        start = self._dataset.shape[0]
+        data = np.array([tuple(entry) for entry in entries], dtype=Catalog.DTYPE)
+        self._dataset.resize((start + len(entries),))
+        self._dataset[start:] = data
+        for row, entry in enumerate(entries, start):
+            self._register(row, *entry)
+
+    def add_class(self, class_name, entries):
+        """
+        Adds the objects of a class that has not been catalogued yet, given as (class name, ID, address, size) entries.
+        In files opened read only the entries are only kept in memory.
+        """
+        entries = [entry for entry in entries if (entry[0], entry[1]) not in self._rows]
+        if self._dataset.file.mode == 'r':
+            for entry in entries:
+                self._register(None, *entry)
+            return
+        self.add(entries)
+        self.classes.add(class_name)
+        self._dataset.attrs['classes'] = sorted(self.classes)
+
+    def remove(self, class_name, ID):
+        row = self._rows.pop((class_name, ID), None)
+        if row is None:
+            return
+        del self._ids[class_name][ID]
+        del self._sizes[(class_name, ID)]
+        address = int(self._dataset[row]['address'])
+        self._addresses.pop(address, None)
+        self._dataset[row] = ('', '', 0, 0)
+
+    def set_size(self, class_name, ID, size):
+        row = self._rows[(class_name, ID)]
+        entry = self._dataset[row]
+        entry['size'] = size
+        self._dataset[row] = entry
+        self._sizes[(class_name, ID)] = size
+
+    def ids(self, class_name):
+        return list(self._ids.get(class_name, {}))
+
+    def size(self, class_name, ID):
+        return self._sizes[(class_name, ID)]
+
+    def lookup(self, address):
+        return self._addresses.get(address)
+
+    def __len__(self):
+        return len(self._rows)
+
+
+class Field():
+    """
+    Names a Scalar attribute in a query. Comparing a field with a value creates a predicate for Query.where, e.g.
+    Field('score_r2') > 0.9.
+    """
+
+    def __init__(self, attr_name):
+        self.attr_name = attr_name
+
+    def __eq__(self, value):
+        return Predicate(self.attr_name, '==', value)
+
+    def __ne__(self, value):
+        return Predicate(self.attr_name, '!=', value)
+
+    def __lt__(self, value):
+        return Predicate(self.attr_name, '<', value)
+
+    def __le__(self, value):
+        return Predicate(self.attr_name, '<=', value)
+
+    def __gt__(self, value):
+        return Predicate(self.attr_name, '>', value)
+
+    def __ge__(self, value):
+        return Predicate(self.attr_name, '>=', value)
+
+    __hash__ = object.__hash__
+
+    def isin(self, values):
+        return Predicate(self.attr_name, 'in', list(values))
+
+
+class Predicate():
+    OPERATORS = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+
+    def __init__(self, attr_name, op, value):
+        self.attr_name = attr_name
+        self.op = op
+        self.value = value
+
+    def matches(self, value):
+        # equality follows the index semantics, so that indexed and scanned attributes give the same results
+        if self.op == '==':
+            return AttributeIndex.key(value) == AttributeIndex.key(self.value)
+        if self.op == '!=':
+            return AttributeIndex.key(value) != AttributeIndex.key(self.value)
+        if self.op == 'in':
+            return AttributeIndex.key(value) in set(AttributeIndex.key(v) for v in self.value)
+        if Predicate.is_missing(value):
+            return False
+        try:
+            return bool(Predicate.OPERATORS[self.op](_decode(value), self.value))
+        except TypeError:
+            return False
+
+    def is_missing(value):
+        value = _decode(value)
+        if isinstance(value, str):
+            return value == UNINITIALIZED_SCALAR
+        return isinstance(value, (float, np.floating)) and np.isnan(value)
+
+    def __repr__(self):
+        return '%s %s %r' % (self.attr_name, self.op, self.value)
+
+
+class Query():
+    """
+    Selects stored objects of a class by their Scalar attributes, e.g.
+    db.query(TrainingResult).where(Field('score_r2') > 0.9).order_by('score_mse').limit(10).all().
+    Equality predicates on indexed attributes are answered by the index, all other predicates read only the Scalar
+    datasets of the attribute and only for the objects that passed the preceding predicates. Only the selected objects
+    are loaded.
+    """
+
+    def __init__(self, db, clazz):
+        self._db = db
+        self._clazz = clazz
+        self._predicates = []
+        self._order = None
+        self._limit = None
+
+    def _copy(self):
+        query = Query(self._db, self._clazz)
+        query._predicates = list(self._predicates)
+        query._order = self._order
+        query._limit = self._limit
+        return query
+
+    def where(self, *predicates, **values):
+        """
+        Returns a query restricted by further predicates, keyword arguments are equality predicates.
+        """
+        query = self._copy()
+        query._predicates.extend(predicates)
+        query._predicates.extend(Field(attr_name) == value for attr_name, value in values.items())
+        return query
+
+    def order_by(self, field, descending=False):
+        query = self._copy()
+        query._order = (field.attr_name if isinstance(field, Field) else field, descending)
+        return query
+
+    def limit(self, count):
+        query = self._copy()
+        query._limit = count
+        return query
+
+    def _check_attributes(self):
+        mapper = self._db.mappers[self._clazz]
+        attr_names = [predicate.attr_name for predicate in self._predicates]
+        if self._order is not None:
+            attr_names.append(self._order[0])
+        for attr_name in attr_names:
+            if attr_name not in mapper.attributes or self._clazz.__dict__[attr_name] is not Scalar:
+                raise Exception('Only Scalar attributes can be queried, %s.%s is not' % (self._clazz.__name__,
+                                                                                          attr_name))
+
+    def ids(self):
+        """
+        Returns the IDs of the selected objects without loading them.
+        """
+        self._check_attributes()
+        candidates = None
+        remaining = []
+        for predicate in self._predicates:
+            index = self._db._indexes.get((self._clazz, predicate.attr_name))
+            if index is not None and predicate.op in ('==', 'in'):
+                values = [predicate.value] if predicate.op == '==' else predicate.value
+                found = set(ID for value in values for ID in index.find(value))
+                candidates = found if candidates is None else candidates & found
+            else:
+                remaining.append(predicate)
+        if candidates is None:
+            IDs = self._db.list_ids(self._clazz)
+        else:
+            IDs = sorted(candidates, key=H5DB._id_sort_key)
+        for predicate in remaining:
+            values = self._db._read_scalars(self._clazz, IDs, [predicate.attr_name])[predicate.attr_name]
+            IDs = [ID for ID, value in zip(IDs, values) if predicate.matches(value)]
+        if self._order is not None:
+            attr_name, descending = self._order
+            values = self._db._read_scalars(self._clazz, IDs, [attr_name])[attr_name]
+            present = [(_decode(value), ID) for ID, value in zip(IDs, values) if not Predicate.is_missing(value)]
+            # objects without a value come last in both directions, as well as objects whose value cannot be compared
+            # with the numbers (or, if there are none, with the strings)
+            kind = (numbers.Number, np.bool_) if any(isinstance(value, (numbers.Number, np.bool_))
+                                                     for value, _ in present) else str
+            present = [(value, ID) for value, ID in present if isinstance(value, kind)]
+            present.sort(key=operator.itemgetter(0), reverse=descending)
+            ordered = set(ID for _, ID in present)
+            IDs = [ID for _, ID in present] + [ID for ID in IDs if ID not in ordered]
+        if self._limit is not None:
+            IDs = IDs[:self._limit]
+        return IDs
+
+    def all(self, lazy=None, fields=None):
+        """
+        Loads the selected objects, see H5DB.load_object for *lazy* and *fields*.
+        """
+        return [self._db.load_object(self._clazz, ID, lazy=lazy, fields=fields) for ID in self.ids()]
+
+    def first(self, lazy=None, fields=None):
+        IDs = self.limit(1).ids()
+        return self._db.load_object(self._clazz, IDs[0], lazy=lazy, fields=fields) if IDs else None
+
+    def count(self):
+        return len(self.ids())
+
+    def __iter__(self):
+        for ID in self.ids():
+            yield self._db.load_object(self._clazz, ID)
+
+
 class H5DBMapper():
     def __init__(self):
         self.group_name = None
+        self.storage_mode = StorageMode.GROUP
+        self.indexes = []
         self.attributes = []
         self.attribute_types = []
+        # routines specialized to the attributes of the class, see compile
+        self.save = None
+        self.save_shared = None
+        self.load = None
+        self.load_row = None
+        self._projections = {}
 
     def __repr__(self):
         return str(self.__dict__)
 
+    def compile(self):
+        """
+        Generates the save and load routines of the class, which write and read the attributes one after the other with
+        the save and read functions of their types bound as globals. Loaded values are put directly into the __dict__
+        of the object.
+
+        save(group, obj, options) and load(group, obj, options) take the group of the object and the per attribute
+        options of the save and read functions, load_row(obj, columns, row) sets the attributes from the columns read
+        from an ObjectTable. save_shared(save_attribute, group, obj, options) passes each attribute to
+        save_attribute(group, attr_name, attr_type, value, options) instead, e.g. to share payloads.
+        """
+        namespace = {}
+        save = ['def save(group, obj, options):']
+        save_shared = ['def save_shared(save_attribute, group, obj, options):']
+        load_row = ['def load_row(obj, columns, row):', '    values = obj.__dict__']
+        for i, (attr_name, attr_type) in enumerate(zip(self.attributes, self.attribute_types)):
+            namespace['save_%d' % (i)] = attr_type.save
+            namespace['type_%d' % (i)] = attr_type
+            save.append('    save_%d(group, %r, obj.%s, **options[%d])' % (i, attr_name, attr_name, i))
+            save_shared.append('    save_attribute(group, %r, type_%d, obj.%s, options[%d])' % (
+                attr_name, i, attr_name, i))
+            load_row.append('    values[%r] = columns[%r][row]' % (attr_name, attr_name))
+        for lines in (save, save_shared, load_row):
+            exec('\n'.join(lines + ['    pass']), namespace)
+        self.save = namespace['save']
+        self.save_shared = namespace['save_shared']
+        self.load_row = namespace['load_row']
+        self.load = self._compile_load(self.attributes)
+        self._projections = {}
+
+    def projection(self, fields):
+        """
+        Returns a load routine like the one of compile that reads only the given attributes, generated on first use.
+        """
+        key = frozenset(fields)
+        load = self._projections.get(key)
+        if load is None:
+            load = self._compile_load([attr_name for attr_name in self.attributes if attr_name in key])
+            self._projections[key] = load
+        return load
+
+    def _compile_load(self, attr_names):
+        namespace = {}
+        load = ['def load(group, obj, options):', '    values = obj.__dict__']
+        for i, (attr_name, attr_type) in enumerate(zip(self.attributes, self.attribute_types)):
+            if attr_name in attr_names:
+                namespace['read_%d' % (i)] = attr_type.read
+                load.append('    values[%r] = read_%d(group, %r, **options[%d])' % (attr_name, i, attr_name, i))
+        exec('\n'.join(load + ['    pass']), namespace)
+        return namespace['load']
+
 
 class H5DBObject():
+    """
+    Base class of the mapped classes. Assignments to mapped attributes are tracked, so that H5DB.update_object only
+    rewrites the attributes that have changed since the object was loaded or saved. Changes inside of an attribute
+    value (e.g. appending to a list) are not noticed, so attributes of the H5DB.MUTABLE_TYPES are rewritten on every
+    update. Classes that announce such changes with mark_dirty set the class attribute h5db_mark_dirty = True to
+    rewrite them only when they are marked.
+    """
 
     def __init__(self, *args, **kwargs):
         for key, value in kwargs.items():
             setattr(self, key, value)
         self.ID = None
 
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        mapper = getattr(type(self), 'mapper', None)
+        if mapper is not None and name in mapper.attributes:
+            self.__dict__.setdefault('_h5db_dirty', set()).add(name)
+
+    def mark_dirty(self, *attr_names):
+        """
+        Marks attributes (by default all) as changed.
+        """
+        mapper = getattr(type(self), 'mapper', None)
+        if not attr_names and mapper is not None:
+            attr_names = mapper.attributes
+        self.__dict__.setdefault('_h5db_dirty', set()).update(attr_names)
+
+    def _h5db_clean(self):
+        # the object is in sync with the file
+        self.__dict__['_h5db_dirty'] = set()
+
     def __repr__(self):
-        return '%s [%s]' % (self.__class__.__name__, str(self.__dict__))
+        return '%s [%s]' % (self.__class__.__name__, str(self.__getstate__()))
+
+    def __getstate__(self):
+        # the bookkeeping of H5DB (attributes starting with _h5db) is neither pickled nor dumped to YAML
+        return {key: value for key, value in self.__dict__.items() if not key.startswith('_h5db')}
+
+
+class ObjectCache():
+    """
+    Identity map of the objects of a H5DB session, keyed by (class, ID).
+
+    Objects are evicted in least recently used order as soon as more than *max_objects* objects or more than
+    *max_bytes* (estimated) bytes are held. Pass None to disable a limit.
+    """
+
+    def __init__(self, max_objects=10000, max_bytes=None):
+        self.max_objects = max_objects
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self._sizes = {}
+        self._total_bytes = 0
+
+    def get(self, clazz, ID):
+        key = (clazz, ID)
+        obj = self._entries.get(key)
+        if obj is not None:
+            self._entries.move_to_end(key)
+        return obj
+
+    def put(self, clazz, ID, obj):
+        key = (clazz, ID)
+        self._discard(key)
+        self._entries[key] = obj
+        if self.max_bytes is not None:
+            size = ObjectCache.estimate_size(obj)
+            self._sizes[key] = size
+            self._total_bytes += size
+        self._evict()
+
+    def invalidate(self, clazz, ID):
+        self._discard((clazz, ID))
+
+    def keys(self):
+        return list(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+        self._sizes.clear()
+        self._total_bytes = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _discard(self, key):
+        if key in self._entries:
+            del self._entries[key]
+            self._total_bytes -= self._sizes.pop(key, 0)
+
+    def _evict(self):
+        while self._entries and self._exceeded():
+            key = next(iter(self._entries))
+            self._discard(key)
+
+    def _exceeded(self):
+        if self.max_objects is not None and len(self._entries) > self.max_objects:
+            return True
+        if self.max_bytes is not None and self._total_bytes > self.max_bytes:
+            return True
+        return False
+
+    def estimate_size(obj):
+        # referenced H5DBObjects are cached on their own and therefore only counted shallowly
+        size = sys.getsizeof(obj)
+        for value in obj.__dict__.values():
+            if isinstance(value, np.ndarray):
+                size += value.nbytes
+            elif isinstance(value, pandas.DataFrame):
+                size += int(value.memory_usage(index=True).sum())
+            else:
+                size += sys.getsizeof(value)
+        return size
+
+
+class IDAllocator():
+    """
+    Hands out the numbers of the object IDs of one class. The counter is persisted in the 'next_id' attribute of the
+    class group in blocks of *block_size* numbers, so that most allocations do not touch the file. Numbers are never
+    handed out twice, not even after the object that used it has been deleted.
+    """
+
+    def __init__(self, class_group, block_size=1024):
+        self._class_group = class_group
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        if 'next_id' in class_group.attrs:
+            self._next = int(class_group.attrs['next_id'])
+        else:
+            # files written before the counter existed
+            self._next = IDAllocator.scan_next_id(class_group)
+        self._limit = self._next
+
+    def reserve(self, count=1):
+        """
+        Reserves *count* consecutive numbers and returns the first one.
+        """
+        with self._lock:
+            start = self._next
+            self._next += count
+            if self._next > self._limit:
+                self._limit = self._next + self.block_size
+                self._class_group.attrs['next_id'] = self._limit
+        return start
+
+    def close(self):
+        # give back the unused rest of the current block
+        with self._lock:
+            if self._limit != self._next:
+                self._class_group.attrs['next_id'] = self._next
+                self._limit = self._next
+
+    def scan_next_id(class_group):
+        next_id = 0
+        for name in class_group:
+            number = name.rsplit('_', 1)[-1]
+            if number.isdigit():
+                next_id = max(next_id, int(number) + 1)
+        return next_id
 
 
 class H5AccessMode(Enum):
@@ -171,12 +1356,154 @@ class H5AccessMode(Enum):
     DEFAULT = 'a'
 
 
-class H5DB():
-    DEFAULT_TYPES = [Scalar, Vector, List, Matrix, DataFrame, Object, ObjectList, Blob]
+class StorageProfile():
+    """
+    HDF5 settings of the file of a H5DB, passed to h5py.File on open:
+
+    :param libver: lowest and highest HDF5 file format version, 'latest' enables the newest (faster, but not readable
+        by old HDF5 libraries) data structures
+    :param driver: file driver, e.g. 'sec2' or 'core', further keyword arguments are driver options
+    :param rdcc_nbytes, rdcc_nslots, rdcc_w0: size, number of hash slots and eviction preference for fully read or
+        written chunks of the raw data chunk cache of each dataset
+    :param mdc_size: initial and maximum size of the metadata cache in bytes
+    :param page_size: page size of files that are created with paged file space management
+    :param page_buffer_size: size of the page buffer, only used for files with paged file space management
+    :param persist_free_space: keep track of free file space across sessions, so that space of deleted and rewritten
+        objects is reused
+    """
 
-    def __init__(self, h5filename, mapped_classes):
+    def __init__(self, libver=None, driver=None, rdcc_nbytes=None, rdcc_nslots=None, rdcc_w0=None, mdc_size=None,
+                 page_size=None, page_buffer_size=None, persist_free_space=False, **driver_options):
+        self.libver = libver
+        self.driver = driver
+        self.rdcc_nbytes = rdcc_nbytes
+        self.rdcc_nslots = rdcc_nslots
+        self.rdcc_w0 = rdcc_w0
+        self.mdc_size = mdc_size
+        self.page_size = page_size
+        self.page_buffer_size = page_buffer_size
+        self.persist_free_space = persist_free_space
+        self.driver_options = driver_options
+
+    def file_options(self, create):
+        """
+        Returns the keyword arguments of h5py.File. The file space options can only be given when a file is created.
+        """
+        options = dict(self.driver_options)
+        for name in ('libver', 'driver', 'rdcc_nbytes', 'rdcc_nslots', 'rdcc_w0'):
+            if getattr(self, name) is not None:
+                options[name] = getattr(self, name)
+        if create and self.page_size is not None:
+            options['fs_strategy'] = 'page'
+            options['fs_page_size'] = self.page_size
+        if create and self.persist_free_space:
+            options['fs_strategy'] = options.get('fs_strategy', 'fsm')
+            options['fs_persist'] = True
+        if self.page_buffer_size is not None:
+            options['page_buf_size'] = self.page_buffer_size
+        return options
+
+    def with_driver(self, driver, **driver_options):
+        """
+        Returns a copy of the profile that uses another file driver.
+        """
+        profile = copy.copy(self)
+        profile.driver = driver
+        profile.driver_options = driver_options
+        return profile
+
+    def open(self, filename, mode, swmr=False):
+        """
+        Opens a h5py.File with the settings of the profile, with swmr=True in SWMR read mode.
+        """
+        if mode == 'a' and not os.path.exists(filename):
+            # h5py accepts file space options only in the modes that create a file
+            mode = 'x'
+        options = self.file_options(mode in ('w', 'w-', 'x'))
+        if swmr:
+            options['swmr'] = True
+        try:
+            h5file = h5py.File(filename, mode, **options)
+        except (OSError, ValueError):
+            if 'page_buf_size' not in options:
+                raise
+            # existing files without paged file space management cannot use a page buffer
+            del options['page_buf_size']
+            h5file = h5py.File(filename, mode, **options)
+        if self.mdc_size is not None:
+            config = h5file.id.get_mdc_config()
+            config.set_initial_size = True
+            config.initial_size = self.mdc_size
+            config.max_size = max(self.mdc_size, config.max_size)
+            config.min_size = min(self.mdc_size, config.min_size)
+            h5file.id.set_mdc_config(config)
+        return h5file
+
+
+StorageProfile.PRESETS = {
+    'default': StorageProfile(),
+    # large chunk and metadata caches that keep chunks once read, page buffered reads of the metadata and small data
+    'read-heavy': StorageProfile(libver='latest', rdcc_nbytes=64 * 1024 * 1024, rdcc_nslots=10007, rdcc_w0=0.0,
+                                 mdc_size=32 * 1024 * 1024, page_size=64 * 1024, page_buffer_size=16 * 1024 * 1024),
+    # a chunk cache that evicts fully written chunks first and reuse of the file space of rewritten objects
+    'write-heavy': StorageProfile(libver='latest', rdcc_nbytes=16 * 1024 * 1024, rdcc_nslots=2003, rdcc_w0=1.0,
+                                  mdc_size=8 * 1024 * 1024, persist_free_space=True),
+}
+
+
+class H5DB():
+    DEFAULT_TYPES = [Scalar, Vector, List, Matrix, DataFrame, Object, ObjectList, Blob, BufferedBlob]
+    # types whose datasets can be chunked and filtered by storage options
+    FILTERABLE_TYPES = [Vector, List, Matrix, DataFrame, Blob, BufferedBlob]
+    # types whose payloads are shared between all owners of equal values if deduplication is enabled
+    DEDUPLICATED_TYPES = [Matrix, DataFrame, Blob, BufferedBlob]
+    # types whose values can be changed in place, without an assignment that marks the attribute as changed
+    MUTABLE_TYPES = [Vector, List, Matrix, DataFrame, ObjectList, Blob, BufferedBlob]
+
+    def __init__(self, h5filename, mapped_classes, cache=None, lazy=False, storage_options=None, memory_map=False,
+                 deduplicate=False, deduplicate_objects=False, storage_profile=None, in_memory=False,
+                 backing_store=False):
+        """
+        :param in_memory: if True, the file is kept in memory by the HDF5 core driver. An existing file is read on open,
+            but changes are only written to it on close if *backing_store* is True. Use snapshot to save the
+            in-memory file explicitly.
+        :param storage_profile: a StorageProfile or the name of one of the StorageProfile.PRESETS ('default',
+            'read-heavy', 'write-heavy') with the HDF5 settings (file format version, caches, file space management,
+            driver) the file is opened with.
+        :param deduplicate_objects: if True, an unsaved object of a class with the class attribute
+            h5db_deduplicate = True is not written if an equal object (same class, equal attribute values and equal
+            referenced objects) is stored already, it takes the ID of the stored object instead. Such objects are
+            shared by all owners, so they should not be changed after saving.
+        :param deduplicate: if True, equal Matrix, DataFrame, Blob and BufferedBlob payloads are written once to a
+            content store in the file and hard linked into every owner. A payload is removed from the store when its
+            last owner is deleted.
+        :param memory_map: if True, Matrix attributes and BufferedBlob buffers stored contiguously and without filters
+            are loaded as read only numpy.memmap instead of being copied into memory.
+        :param storage_options: dict mapping attribute types (e.g. h5db.Matrix) to dicts of h5py dataset options
+            (compression, compression_opts, shuffle, fletcher32, chunks). A mapped class can override them per attribute
+            with a class attribute h5db_storage_options = {attr_name: {...}}. Chunk shapes are sized automatically
+            unless given.
+        """
         self._h5backend = None
         self._h5filename = h5filename
+        self._cache = cache if cache is not None else ObjectCache()
+        # lazy is the default mode of load_object, _lazy_loading the mode of the load that is currently running
+        self.lazy = lazy
+        self._lazy_loading = False
+        # objects queued by save_object inside of a batch() block, keys of the deduplicated ones and their duplicates
+        self._batch = None
+        self._batch_known = None
+        self._batch_duplicates = None
+        self._batch_ids = None
+        # ID allocators and object tables of the mapped classes, created on first use
+        self._allocators = {}
+        self._tables = {}
+        # raw references (see _reference_keys) mapped to the class and the ID of the referenced object
+        self._references = {}
+        # the classes stored as table by the addresses of their ids datasets
+        self._table_addresses = {}
+        # the catalog of the stored objects, see _init_catalog
+        self._catalog = None
 
         # construct class mappers
         for clazz in mapped_classes:
@@ -185,96 +1512,1261 @@ class H5DB():
         self.mappers = {clazz: clazz.mapper for clazz in mapped_classes}
         self.name_to_class = {clazz.__name__:clazz for clazz in mapped_classes}
 
-    def open(self, access_mode = H5AccessMode.DEFAULT):
-        self._h5backend = h5py.File(self._h5filename, access_mode.value)
-        self._init_object_mapper()
+        # storage options of the attributes, in the order of the mapper attributes
+        self.storage_options = storage_options or {}
+        self._attribute_options = {clazz: self._resolve_storage_options(clazz) for clazz in mapped_classes}
+        self.deduplicate = deduplicate
+        if storage_profile is None or isinstance(storage_profile, str):
+            storage_profile = StorageProfile.PRESETS[storage_profile or 'default']
+        if in_memory:
+            storage_profile = storage_profile.with_driver('core', backing_store=backing_store)
+        self.storage_profile = storage_profile
+        self.deduplicate_objects = deduplicate_objects
+        # options of the read functions of the attribute types
+        self._read_options = {Matrix: {'mmap': True}, BufferedBlob: {'mmap': True}} if memory_map else {}
+        self._attribute_read_options = {clazz: [self._read_options.get(attr_type, {}) for attr_type
+                                                in self.mappers[clazz].attribute_types] for clazz in mapped_classes}
+
+    def open(self, access_mode = H5AccessMode.DEFAULT, swmr=False):
+        """
+        Opens the file. With swmr=True a file is opened for reading while a writer appends to it, see start_swmr_write.
+        """
+        self._h5backend = self.storage_profile.open(self._h5filename, access_mode.value, swmr)
+        self._cache.clear()
+        self._tables.clear()
+        self._references.clear()
+        self._table_addresses = {}
         self._init_top_level_groups()
+        self._init_catalog()
+        self._init_indexes()
 
     def _create_class_mapper(clazz):
         # initialize mapper only once for each class
         if not hasattr(clazz, 'mapper'):
             mapper = H5DBMapper()
             mapper.group_name = clazz.__name__
+            mapper.storage_mode = getattr(clazz, 'h5db_storage', StorageMode.GROUP)
             for attr_name, attr_val in clazz.__dict__.items():
                 if attr_val in H5DB.DEFAULT_TYPES:
                     mapper.attributes.append(attr_name)
                     mapper.attribute_types.append(attr_val)
+            if mapper.storage_mode is StorageMode.TABLE and any(t is not Scalar for t in mapper.attribute_types):
+                raise Exception('Class %s cannot be stored as table, it has non Scalar attributes' % (clazz.__name__))
+            for attr_name in getattr(clazz, 'h5db_indexes', []):
+                if attr_name not in mapper.attributes or clazz.__dict__[attr_name] is not Scalar:
+                    raise Exception('Only Scalar attributes can be indexed, %s.%s is not' % (clazz.__name__, attr_name))
+                mapper.indexes.append(attr_name)
+            if getattr(clazz, 'h5db_deduplicate', False) and mapper.storage_mode is StorageMode.TABLE:
+                raise Exception('Class %s cannot be deduplicated, it is stored as table' % (clazz.__name__))
+            mapper.compile()
             clazz.mapper = mapper
 
-    def _init_object_mapper(self):
-        Object._h5db = self
+    def _resolve_storage_options(self, clazz):
+        mapper = self.mappers[clazz]
+        class_options = getattr(clazz, 'h5db_storage_options', {})
+        attribute_options = []
+        for attr_name, attr_type in zip(mapper.attributes, mapper.attribute_types):
+            options = dict(self.storage_options.get(attr_type, {}))
+            options.update(class_options.get(attr_name, {}))
+            if options and attr_type not in H5DB.FILTERABLE_TYPES:
+                raise Exception('Storage options are not supported for attribute %s of class %s' % (
+                    attr_name, clazz.__name__))
+            attribute_options.append(options)
+        return attribute_options
 
     def _init_top_level_groups(self):
         for clazz, mapper in self.mappers.items():
             if mapper.group_name not in self._h5backend:
                 self._h5backend.create_group(mapper.group_name)
 
+    def _init_catalog(self):
+        # build the catalog if it is missing, e.g. in files written by earlier versions, and add the objects of the
+        # classes that have not been catalogued yet. Files without catalog that are opened read only are listed from
+        # their groups.
+        path = META_GROUP + '/catalog'
+        self._catalog = None
+        if path in self._h5backend:
+            self._catalog = Catalog(self._h5backend[path])
+        elif self._h5backend.mode != 'r':
+            dataset = self._h5backend.create_dataset(path, shape=(0,), maxshape=(None,), dtype=Catalog.DTYPE,
+                                                     chunks=(1024,))
+            self._catalog = Catalog(dataset)
+        else:
+            return
+        for clazz, mapper in self.mappers.items():
+            if mapper.group_name not in self._catalog.classes:
+                IDs = self._scan_ids(clazz)
+                self._catalog.add_class(mapper.group_name, [self._catalog_entry(clazz, ID) for ID in IDs])
+
+    def _catalog_entry(self, clazz, ID):
+        mapper = self.mappers[clazz]
+        if mapper.storage_mode is StorageMode.TABLE:
+            return mapper.group_name, ID, 0, self._h5backend[mapper.group_name]['table'].dtype.itemsize
+        group = self._h5backend[mapper.group_name][ID]
+        return mapper.group_name, ID, h5py.h5o.get_info(group.id).addr, H5DB._payload_size(group)
+
+    def _payload_size(group):
+        # the storage size of all datasets of an object group
+        sizes = []
+        group.visititems(lambda name, item: sizes.append(item.id.get_storage_size())
+                         if isinstance(item, h5py.Dataset) else None)
+        return sum(sizes)
+
+    def _catalog_add(self, objects):
+        if self._catalog is not None:
+            self._catalog.add([self._catalog_entry(obj.__class__, obj.ID) for obj in objects])
+
+    def _init_indexes(self):
+        # build the indexes that are declared, but missing in the file, e.g. in files written by earlier versions
+        self._indexes = {}
+        for clazz, mapper in self.mappers.items():
+            for attr_name in mapper.indexes:
+                path = '%s/indexes/%s/%s' % (META_GROUP, mapper.group_name, attr_name)
+                if path in self._h5backend:
+                    self._indexes[(clazz, attr_name)] = AttributeIndex(self._h5backend[path], mapper.group_name)
+                elif self._h5backend.mode != 'r':
+                    index = AttributeIndex(self._h5backend.create_group(path), mapper.group_name)
+                    IDs = self.list_ids(clazz)
+                    for ID, value in zip(IDs, self._read_scalars(clazz, IDs, [attr_name])[attr_name]):
+                        index.add(ID, value)
+                    self._indexes[(clazz, attr_name)] = index
+
+    def _read_scalars(self, clazz, IDs, attr_names):
+        # reads some Scalar attributes of stored objects as lists of values, without creating the objects
+        mapper = self.mappers[clazz]
+        if mapper.storage_mode is StorageMode.TABLE:
+            _, columns = self._table(clazz).read(IDs)
+            return {attr_name: list(columns[attr_name]) for attr_name in attr_names}
+        class_group = self._h5backend[mapper.group_name]
+        groups = [class_group[ID] for ID in IDs]
+        return {attr_name: [Scalar.read(group, attr_name) for group in groups] for attr_name in attr_names}
+
+    def _index_add(self, obj, attr_names=None):
+        for attr_name in self.mappers[obj.__class__].indexes if attr_names is None else attr_names:
+            index = self._indexes.get((obj.__class__, attr_name))
+            if index is not None:
+                index.add(obj.ID, getattr(obj, attr_name))
+
+    def _index_remove(self, clazz, ID, attr_names=None):
+        attr_names = self.mappers[clazz].indexes if attr_names is None else attr_names
+        indexes = [(attr_name, self._indexes.get((clazz, attr_name))) for attr_name in attr_names]
+        indexes = [(attr_name, index) for attr_name, index in indexes if index is not None]
+        if indexes:
+            values = self._read_scalars(clazz, [ID], [attr_name for attr_name, _ in indexes])
+            for attr_name, index in indexes:
+                index.remove(ID, values[attr_name][0])
+
+    def find_ids(self, clazz, attr_name, value):
+        """
+        Returns the IDs of all objects of a class whose Scalar attribute *attr_name* equals *value*. Declared indexes
+        (class attribute h5db_indexes) answer without reading the objects, other attributes are compared one by one.
+        """
+        return self.query(clazz).where(Field(attr_name) == value).ids()
+
+    def find_by(self, clazz, attr_name, value):
+        """
+        Loads all objects of a class whose Scalar attribute *attr_name* equals *value*, see find_ids.
+        """
+        return [self.load_object(clazz, ID) for ID in self.find_ids(clazz, attr_name, value)]
+
+    def scan(self, clazz, fields=None):
+        """
+        Reads Scalar attributes (by default all) of all stored objects of a class into a pandas.DataFrame indexed by
+        the IDs, without creating the objects. Missing values are NaN.
+        """
+        mapper = self.mappers[clazz]
+        if fields is None:
+            fields = [attr_name for attr_name, attr_type in zip(mapper.attributes, mapper.attribute_types)
+                      if attr_type is Scalar]
+        for attr_name in fields:
+            if attr_name not in mapper.attributes or clazz.__dict__[attr_name] is not Scalar:
+                raise Exception('Only Scalar attributes can be scanned, %s.%s is not' % (clazz.__name__, attr_name))
+        IDs = self.list_ids(clazz)
+        values = self._read_scalars(clazz, IDs, fields)
+        columns = collections.OrderedDict()
+        for attr_name in fields:
+            columns[attr_name] = [np.nan if Predicate.is_missing(value) else _decode(value)
+                                  for value in values[attr_name]]
+        return pandas.DataFrame(columns, index=pandas.Index(IDs, name='ID'), columns=fields)
+
+    def query(self, clazz):
+        """
+        Returns a Query over the stored objects of a class.
+        """
+        return Query(self, clazz)
+
     def close(self):
+        for allocator in self._allocators.values():
+            allocator.close()
+        self._allocators.clear()
+        self._tables.clear()
+        self._references.clear()
+        self._cache.clear()
         self._h5backend.close()
 
+    def start_swmr_write(self):
+        """
+        Switches the file to SWMR (single writer, multiple readers) mode: processes that open the file with swmr=True
+        can read the rows appended by DataFrameAppenders while they are written. No objects can be saved, updated or
+        deleted afterwards, so open all appenders before. The file must have been created with libver='latest', e.g.
+        with one of the storage profile presets 'read-heavy' or 'write-heavy'.
+        """
+        self._h5backend.swmr_mode = True
+
+    def snapshot(self, path):
+        """
+        Writes the current state of the opened file, e.g. of an in-memory file, to *path*.
+        """
+        self._h5backend.flush()
+        image = self._h5backend.id.get_file_image()
+        with open(path, 'wb') as snapshot_file:
+            snapshot_file.write(image)
+
+    @_session
     def save_object(self, obj):
         # looking up a suitable mapper
         if obj.__class__ not in self.mappers:
             raise Exception('Unkown class encountered: %s' % (obj.__class__.__name__))
         mapper = self.mappers[obj.__class__]
 
-        if obj.ID is None:
-            obj.ID = '%s_%d' % (mapper.group_name, len(self._h5backend[mapper.group_name]))
-
-            # create a group for the object [--> obj must have an ID]
-            target_group = self._h5backend[mapper.group_name].create_group(obj.ID)
-            # save attributes of the object
-            for attr_name, attr_type in zip(mapper.attributes, mapper.attribute_types):
-                attr_type.save(target_group, attr_name, getattr(obj, attr_name))
-            ref = target_group.ref
+        if self._batch is not None and (obj.ID is None or (obj.__class__, obj.ID) in self._batch_ids):
+            if obj.ID is None:
+                # allocate the IDs of the object graph now, write it when the batch is committed
+                pending, duplicates = self._collect_unsaved([obj], self._batch_known)
+                self._allocate_ids(pending, duplicates)
+                self._batch.extend(pending)
+                self._batch_duplicates.extend(duplicates)
+                self._batch_ids.update((pending_obj.__class__, pending_obj.ID) for pending_obj in pending)
+            ref = None
+        elif obj.ID is None:
+            equal = self._find_equal(obj)
+            if equal is not None:
+                obj.ID = equal
+                return self._reference(mapper, obj.ID)
+            obj.ID = self.reserve_ids(obj.__class__)[0]
+            try:
+                ref = self._write_object(mapper, obj)
+            except BaseException:
+                self._rollback([obj])
+                raise
+            self._catalog_add([obj])
+            self._index_add(obj)
+            # the saved instance becomes the identity of the stored object
+            self._cache.put(obj.__class__, obj.ID, obj)
         else:
-            ref = self._h5backend[mapper.group_name][obj.ID].ref
+            ref = self._reference(mapper, obj.ID)
         return ref
 
+    def _reference(self, mapper, ID):
+        if mapper.storage_mode is StorageMode.TABLE:
+            return self._table(self.name_to_class[mapper.group_name]).reference(ID)
+        return self._h5backend[mapper.group_name][ID].ref
+
+    def _table(self, clazz):
+        table = self._tables.get(clazz)
+        if table is None:
+            mapper = self.mappers[clazz]
+            table = ObjectTable(self._h5backend[mapper.group_name], mapper)
+            self._tables[clazz] = table
+        return table
+
+    def _exists(self, clazz, ID):
+        mapper = self.mappers[clazz]
+        if mapper.storage_mode is StorageMode.TABLE:
+            return ID in self._table(clazz)
+        return ID in self._h5backend[mapper.group_name]
+
+    @_session
+    def save_objects(self, objects):
+        """
+        Saves several objects together with all referenced objects that have not been saved yet. IDs are allocated up
+        front, the groups are created class by class and the attributes are written attribute by attribute, followed by
+        a single flush. Returns the references of the given objects.
+        """
+        objects = list(objects)
+        pending, duplicates = self._collect_unsaved(objects, {})
+        self._allocate_ids(pending, duplicates)
+        try:
+            self._write_objects(pending)
+        except BaseException:
+            self._rollback(pending + [obj for obj, _ in duplicates])
+            raise
+        return [self.save_object(obj) for obj in objects]
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Defers all save_object calls inside of the with block. The saved objects get their IDs immediately, but are
+        written in grouped passes with a single flush when the block is left. save_object returns None while a batch is
+        open. If the block or the write fails, nothing of the batch is kept and the objects lose their new IDs.
+        """
+        if self._batch is not None:
+            # nested blocks are part of the outer batch
+            yield self
+            return
+        self._batch = []
+        self._batch_known = {}
+        self._batch_duplicates = []
+        self._batch_ids = set()
+        try:
+            yield self
+        except BaseException:
+            pending, self._batch = self._batch, None
+            self._rollback(pending + [obj for obj, _ in self._batch_duplicates])
+            self._batch_known = self._batch_duplicates = self._batch_ids = None
+            raise
+        pending, self._batch = self._batch, None
+        duplicates = [obj for obj, _ in self._batch_duplicates]
+        self._batch_known = self._batch_duplicates = self._batch_ids = None
+        try:
+            self._write_objects(pending)
+        except BaseException:
+            self._rollback(pending + duplicates)
+            raise
+
+    def _collect_unsaved(self, objects, known):
+        # collect the unsaved objects of the graph, each object once, in depth first order. Objects that equal a stored
+        # object take its ID, objects that equal an earlier collected one (*known* maps the keys of the collected
+        # objects to them) are returned as pairs of duplicate and original
+        pending = []
+        duplicates = []
+        seen = set()
+        stack = list(reversed(objects))
+        while stack:
+            obj = stack.pop()
+            if obj is None or obj.ID is not None or id(obj) in seen:
+                continue
+            if obj.__class__ not in self.mappers:
+                raise Exception('Unkown class encountered: %s' % (obj.__class__.__name__))
+            seen.add(id(obj))
+            key = self._structure_key(obj) if self._is_deduplicated(obj.__class__) else None
+            if key is not None:
+                ID = self._find_structure(obj.__class__, key)
+                if ID is not None:
+                    obj.ID = ID
+                    continue
+                if key in known:
+                    duplicates.append((obj, known[key]))
+                    continue
+                known[key] = obj
+            pending.append(obj)
+            mapper = self.mappers[obj.__class__]
+            for attr_name, attr_type in reversed(list(zip(mapper.attributes, mapper.attribute_types))):
+                if attr_type is Object:
+                    stack.append(getattr(obj, attr_name))
+                elif attr_type is ObjectList:
+                    stack.extend(reversed(list(getattr(obj, attr_name))))
+        return pending, duplicates
+
+    def _is_deduplicated(self, clazz):
+        return self.deduplicate_objects and getattr(clazz, 'h5db_deduplicate', False)
+
+    def _find_equal(self, obj):
+        # the ID of a stored object that equals the given unsaved one
+        if not self._is_deduplicated(obj.__class__):
+            return None
+        key = self._structure_key(obj)
+        return self._find_structure(obj.__class__, key) if key is not None else None
+
+    def _find_structure(self, clazz, key):
+        entries = self._h5backend.get('%s/structures/%s' % (META_GROUP, self.mappers[clazz].group_name))
+        if entries is None or key not in entries:
+            return None
+        ID = entries.get(key, getlink=True).path.rpartition('/')[2]
+        return ID if self._exists(clazz, ID) else None
+
+    def _structure_key(self, obj, active=None):
+        # digest of the class and the values of an object, None if it cannot be compared by value
+        if obj is None:
+            return 'None'
+        clazz = obj.__class__
+        if obj.ID is not None:
+            group = self._h5backend[self.mappers[clazz].group_name].get(obj.ID)
+            if group is not None and 'h5db_structure' in group.attrs:
+                return group.attrs['h5db_structure']
+        if not self._is_deduplicated(clazz):
+            return 'ID:' + obj.ID if obj.ID is not None else None
+        active = active if active is not None else set()
+        if id(obj) in active:
+            # cyclic graphs are not deduplicated
+            return None
+        active.add(id(obj))
+        mapper = self.mappers[clazz]
+        digest = hashlib.sha256(clazz.__name__.encode())
+        for attr_name, attr_type in zip(mapper.attributes, mapper.attribute_types):
+            value = getattr(obj, attr_name)
+            if attr_type is Object:
+                value = self._structure_key(value, active)
+            elif attr_type is ObjectList:
+                value = [self._structure_key(item, active) for item in (value or [])]
+                value = None if None in value else value
+            elif attr_type in H5DB.DEDUPLICATED_TYPES:
+                content = attr_type.content(value)
+                if content is not None:
+                    content_digest = hashlib.sha256()
+                    for chunk in content:
+                        content_digest.update(chunk)
+                    value = content_digest.hexdigest()
+                else:
+                    value = repr(value)
+            else:
+                value = H5DB._plain(value)
+            if value is None:
+                active.discard(id(obj))
+                return None
+            digest.update(('%s=%r;' % (attr_name, value)).encode())
+        active.discard(id(obj))
+        return digest.hexdigest()
+
+    def _plain(value):
+        # a comparable form of a value as written and as read, sequences as lists and bytes as str
+        if isinstance(value, (list, tuple)) or (isinstance(value, np.ndarray) and value.ndim > 0):
+            return [H5DB._plain(item) for item in value]
+        return AttributeIndex.key(value)
+
+    def _register_structure(self, obj):
+        # records the key of a written object, so that equal objects saved later can take its ID
+        if not self._is_deduplicated(obj.__class__):
+            return
+        group = self._h5backend[self.mappers[obj.__class__].group_name][obj.ID]
+        if 'h5db_structure' in group.attrs:
+            del group.attrs['h5db_structure']
+        key = self._structure_key(obj)
+        if key is None:
+            return
+        group.attrs['h5db_structure'] = key
+        entries = self._h5backend.require_group('%s/structures/%s' % (META_GROUP, obj.__class__.mapper.group_name))
+        if key not in entries or self._find_structure(obj.__class__, key) is None:
+            if key in entries:
+                del entries[key]
+            entries[key] = h5py.SoftLink(group.name)
+
+    def _unregister_structure(self, clazz, ID):
+        group = self._h5backend[self.mappers[clazz].group_name][ID]
+        key = group.attrs.get('h5db_structure')
+        entries = self._h5backend.get('%s/structures/%s' % (META_GROUP, self.mappers[clazz].group_name))
+        if key is None or entries is None or key not in entries:
+            return
+        if entries.get(key, getlink=True).path == group.name:
+            del entries[key]
+
+    def reserve_ids(self, clazz, count=1):
+        """
+        Reserves *count* new IDs for objects of the given class.
+        """
+        mapper = self.mappers[clazz]
+        allocator = self._allocators.get(clazz)
+        if allocator is None:
+            allocator = IDAllocator(self._h5backend[mapper.group_name])
+            self._allocators[clazz] = allocator
+        start = allocator.reserve(count)
+        return ['%s_%d' % (mapper.group_name, number) for number in range(start, start + count)]
+
+    def _allocate_ids(self, objects, duplicates=()):
+        objects_by_class = collections.OrderedDict()
+        for obj in objects:
+            objects_by_class.setdefault(obj.__class__, []).append(obj)
+        for clazz, class_objects in objects_by_class.items():
+            for obj, ID in zip(class_objects, self.reserve_ids(clazz, len(class_objects))):
+                obj.ID = ID
+        for obj, original in duplicates:
+            obj.ID = original.ID
+
+    def _rollback(self, objects):
+        # removes what a failed write has stored of the given new objects (or duplicates of them) and forgets their
+        # IDs, the numbers themselves are not reused
+        for obj in objects:
+            if obj.ID is None:
+                continue
+            clazz = obj.__class__
+            mapper = self.mappers[clazz]
+            if self._exists(clazz, obj.ID):
+                for attr_name in mapper.indexes:
+                    index = self._indexes.get((clazz, attr_name))
+                    if index is not None:
+                        index.remove(obj.ID, getattr(obj, attr_name))
+                if mapper.storage_mode is StorageMode.TABLE:
+                    self._table(clazz).delete(obj.ID)
+                else:
+                    keys = self._content_keys(self._h5backend[mapper.group_name][obj.ID])
+                    self._unregister_structure(clazz, obj.ID)
+                    del self._h5backend[mapper.group_name][obj.ID]
+                    self._release_content(keys)
+                if self._catalog is not None:
+                    self._catalog.remove(mapper.group_name, obj.ID)
+                self._cache.invalidate(clazz, obj.ID)
+            obj.ID = None
+        self._references.clear()
+
+    @_session
+    def _write_objects(self, objects):
+        objects_by_class = collections.OrderedDict()
+        for obj in objects:
+            objects_by_class.setdefault(obj.__class__, []).append(obj)
+
+        # first pass: create all groups and table rows, so that references between the new objects can be written
+        groups = {}
+        for clazz, class_objects in objects_by_class.items():
+            mapper = self.mappers[clazz]
+            if mapper.storage_mode is StorageMode.TABLE:
+                self._table(clazz).write(class_objects)
+                continue
+            class_group = self._h5backend[mapper.group_name]
+            for obj in class_objects:
+                groups[id(obj)] = class_group.create_group(obj.ID)
+
+        # second pass: write the attributes with the routines of the classes
+        for clazz, class_objects in objects_by_class.items():
+            mapper = self.mappers[clazz]
+            attribute_options = self._attribute_options[clazz]
+            for obj in class_objects if mapper.storage_mode is not StorageMode.TABLE else []:
+                if self.deduplicate:
+                    mapper.save_shared(self._save_attribute, groups[id(obj)], obj, attribute_options)
+                else:
+                    mapper.save(groups[id(obj)], obj, attribute_options)
+            self._catalog_add(class_objects)
+            for obj in class_objects:
+                obj._h5db_clean()
+                self._register_structure(obj)
+                self._index_add(obj)
+                self._cache.put(clazz, obj.ID, obj)
+        self._h5backend.flush()
+
+    def _write_object(self, mapper, obj):
+        if mapper.storage_mode is StorageMode.TABLE:
+            table = self._table(obj.__class__)
+            table.write([obj])
+            obj._h5db_clean()
+            return table.reference(obj.ID)
+        # create a group for the object [--> obj must have an ID]
+        target_group = self._h5backend[mapper.group_name].create_group(obj.ID)
+        # save attributes of the object
+        attribute_options = self._attribute_options[obj.__class__]
+        if self.deduplicate:
+            mapper.save_shared(self._save_attribute, target_group, obj, attribute_options)
+        else:
+            mapper.save(target_group, obj, attribute_options)
+        obj._h5db_clean()
+        self._register_structure(obj)
+        return target_group.ref
+
+    def _save_attribute(self, group, attr_name, attr_type, value, options):
+        content = attr_type.content(value) if self.deduplicate and attr_type in H5DB.DEDUPLICATED_TYPES else None
+        if content is None:
+            attr_type.save(group, attr_name, value, **options)
+            return
+        digest = hashlib.sha256()
+        digest.update(('%s %r' % (attr_type.__name__, sorted(options.items()))).encode())
+        for chunk in content:
+            digest.update(chunk)
+        key = digest.hexdigest()
+        store = self._h5backend.require_group(META_GROUP + '/content')
+        if key not in store:
+            attr_type.save(store, key, value, **options)
+            store[key].attrs['h5db_content'] = key
+        # a hard link, HDF5 counts the links of the payload
+        group[attr_name] = store[key]
+
+    def _update_attribute(self, group, attr_name, attr_type, value, options):
+        # overwrites a stored attribute, numeric datasets in place if their dtype and shape allow it. Other values are
+        # written under a temporary name first and swapped in, so that a failing write keeps the stored value.
+        current = group.get(attr_name)
+        if current is None:
+            self._save_attribute(group, attr_name, attr_type, value, options)
+            return
+        key = current.attrs.get('h5db_content')
+        if key is None and attr_type in (Scalar, Vector, Matrix) and isinstance(current, h5py.Dataset):
+            data = np.asarray(ObjectTable.normalize(value) if attr_type is Scalar else value)
+            if _overwrite(current, data):
+                return
+        new_name = attr_name + '.h5db_new'
+        if new_name in group:
+            del group[new_name]
+        try:
+            self._save_attribute(group, new_name, attr_type, value, options)
+        except BaseException:
+            if new_name in group:
+                del group[new_name]
+            raise
+        del group[attr_name]
+        group.move(new_name, attr_name)
+        if key is not None:
+            self._release_content([key])
+
+    def _content_keys(self, group):
+        # the content store keys of the shared payloads of an object group
+        return [item.attrs['h5db_content'] for item in group.values() if 'h5db_content' in item.attrs]
+
+    def _release_content(self, keys):
+        # removes payloads from the content store which are no longer linked by any owner
+        store = self._h5backend.get(META_GROUP + '/content')
+        for key in keys:
+            if store is not None and key in store and h5py.h5o.get_info(store[key].id).rc <= 1:
+                del store[key]
+
     def delete_object(self, clazz, ID):
         # looking up a suitable mapper
         mapper = self.mappers[clazz]
-        del self._h5backend[mapper.group_name][ID]
-
-    def update_object(self, obj):
-        # first delete the old object,
-        self.delete_object(obj.__class__, obj.ID)
-        # then save the new object
-        self.save_object(obj)
+        self._index_remove(clazz, ID)
+        if mapper.storage_mode is StorageMode.TABLE:
+            self._table(clazz).delete(ID)
+        else:
+            keys = self._content_keys(self._h5backend[mapper.group_name][ID])
+            self._unregister_structure(clazz, ID)
+            del self._h5backend[mapper.group_name][ID]
+            self._release_content(keys)
+        if self._catalog is not None:
+            self._catalog.remove(mapper.group_name, ID)
+        # the address of the deleted object can be reused by new objects
+        self._references.clear()
+        self._cache.invalidate(clazz, ID)
+
+    @_session
+    def update_object(self, obj, _updated=None):
+        """
+        Writes the changes of a saved object. The attributes that have been assigned (or marked with mark_dirty) since
+        the object was loaded or saved are rewritten, numeric datasets in place where possible, as well as the loaded
+        attributes of mutable types unless the class sets h5db_mark_dirty (see H5DBObject); objects without this
+        bookkeeping are rewritten completely. Referenced saved objects with changes are updated as well.
+        """
+        mapper = self.mappers[obj.__class__]
+        dirty = obj.__dict__.get('_h5db_dirty')
+        unloaded = obj.__dict__.get('_h5db_unloaded') or set()
+        if dirty is not None and not getattr(obj.__class__, 'h5db_mark_dirty', False):
+            # values of mutable types may have been changed in place
+            dirty = dirty.union(attr_name for attr_name, attr_type in zip(mapper.attributes, mapper.attribute_types)
+                                if attr_type in H5DB.MUTABLE_TYPES and attr_name not in unloaded)
+        if mapper.storage_mode is StorageMode.TABLE and unloaded:
+            raise Exception('%s has been loaded partially and cannot be updated' % (obj.ID))
+        # the index entries of attributes that have neither been loaded nor assigned stay as they are
+        indexed = [attr_name for attr_name in mapper.indexes if attr_name not in unloaded or attr_name in (dirty or ())]
+        self._index_remove(obj.__class__, obj.ID, indexed)
+        if mapper.storage_mode is StorageMode.TABLE:
+            # the row is overwritten in place, so that references to it stay valid
+            self._write_object(mapper, obj)
+        else:
+            # the group is kept, so that references to it stay valid
+            group = self._h5backend[mapper.group_name][obj.ID]
+            attribute_options = self._attribute_options[obj.__class__]
+            for attr_name, attr_type, options in zip(mapper.attributes, mapper.attribute_types, attribute_options):
+                if dirty is None or attr_name in dirty:
+                    self._update_attribute(group, attr_name, attr_type, getattr(obj, attr_name), options)
+            obj._h5db_clean()
+            unloaded.difference_update(dirty or ())
+            if self._is_deduplicated(obj.__class__):
+                self._unregister_structure(obj.__class__, obj.ID)
+                # the key of a partially loaded object is computed from all of its stored attributes
+                self._register_structure(self.load_object(obj.__class__, obj.ID, fields=mapper.attributes)
+                                         if unloaded else obj)
+            if self._catalog is not None:
+                self._catalog.set_size(mapper.group_name, obj.ID, H5DB._payload_size(group))
+        self._index_add(obj, indexed)
+        if not unloaded:
+            self._cache.put(obj.__class__, obj.ID, obj)
+
+        # update the changed objects of the object graph
+        updated = _updated if _updated is not None else set()
+        updated.add(id(obj))
+        for child in self._referenced_objects(obj):
+            if id(child) not in updated and child.ID is not None and child.__dict__.get('_h5db_dirty'):
+                self.update_object(child, updated)
+        self._h5backend.flush()
+
+    def _referenced_objects(self, obj):
+        # the loaded objects referenced by the Object and ObjectList attributes of an object
+        mapper = self.mappers[obj.__class__]
+        for attr_name, attr_type in zip(mapper.attributes, mapper.attribute_types):
+            values = getattr(obj, attr_name, None)
+            if attr_type is Object:
+                values = [values]
+            elif attr_type is not ObjectList or values is None:
+                continue
+            for value in values:
+                if type(value) is ObjectProxy:
+                    # proxies that have not been resolved cannot have changed
+                    value = value._proxy_target
+                if isinstance(value, H5DBObject):
+                    yield value
+
+    @_session
+    def load_object(self, clazz, ID, lazy=None, fields=None):
+        """
+        Loads the object with the given ID. In lazy mode, referenced objects are returned as ObjectProxy instances which
+        are loaded on first access. If a list of *fields* is given, only these attributes are read and all others are
+        set to None; such partially loaded objects are not added to the identity map, an update only writes the
+        attributes that have been assigned afterwards.
+        """
+        # shared references resolve to the same instance as long as it is cached
+        obj = self._cache.get(clazz, ID)
+        if obj is not None:
+            return obj
 
-    def load_object(self, clazz, ID):
         # looking up a suitable mapper
         mapper = self.mappers[clazz]
+        if mapper.storage_mode is StorageMode.TABLE:
+            return self._load_table_objects(clazz, [ID], fields)[0]
         # find group with the object id
         parent_group = self._h5backend[mapper.group_name][ID]
 
         # create result object
         obj = clazz()
         obj.ID = ID
+        if fields is None:
+            # register it before its attributes are read, so that cyclic references terminate
+            self._cache.put(clazz, ID, obj)
+        else:
+            self._project(obj, fields)
 
         # populate properties of the result
-        for attr_name, attr_type in zip(mapper.attributes, mapper.attribute_types):
-            setattr(obj, attr_name, attr_type.read(parent_group, attr_name))
+        outer_lazy_loading = self._lazy_loading
+        self._lazy_loading = self.lazy if lazy is None else lazy
+        try:
+            if fields is None:
+                mapper.load(parent_group, obj, self._attribute_read_options[clazz])
+            else:
+                mapper.projection(fields)(parent_group, obj, self._attribute_read_options[clazz])
+        finally:
+            self._lazy_loading = outer_lazy_loading
+        obj._h5db_clean()
+        if fields is None:
+            # update the size estimate of the now populated object
+            self._cache.put(clazz, ID, obj)
         return obj
 
-    def load_objects(self, clazz):
+    def _project(self, obj, fields):
+        # sets the attributes that are not part of the projection to None and returns the ones to read
+        mapper = self.mappers[obj.__class__]
+        unknown = set(fields).difference(mapper.attributes)
+        if unknown:
+            raise Exception('Unknown attributes of class %s: %s' % (obj.__class__.__name__, ', '.join(sorted(unknown))))
+        attributes = []
+        unloaded = set()
+        for attr_name, attr_type in zip(mapper.attributes, mapper.attribute_types):
+            if attr_name in fields:
+                attributes.append((attr_name, attr_type))
+            else:
+                setattr(obj, attr_name, None)
+                unloaded.add(attr_name)
+        obj._h5db_unloaded = unloaded
+        return attributes
+
+    def invalidate(self, clazz=None, ID=None):
+        """
+        Drops a single object (or, without arguments, all objects) from the identity map, so that it is read from the
+        file on its next load.
+        """
+        if clazz is None:
+            self._cache.clear()
+        else:
+            self._cache.invalidate(clazz, ID)
+
+    def _load_table_objects(self, clazz, IDs=None, fields=None):
+        # read the rows with a single read and build the objects that are not cached yet
+        mapper = self.mappers[clazz]
+        IDs, columns = self._table(clazz).read(IDs)
+        objects = []
+        for i, ID in enumerate(IDs):
+            obj = self._cache.get(clazz, ID)
+            if obj is None:
+                obj = clazz()
+                obj.ID = ID
+                if fields is None:
+                    mapper.load_row(obj, columns, i)
+                else:
+                    for attr_name, _ in self._project(obj, fields):
+                        setattr(obj, attr_name, columns[attr_name][i])
+                obj._h5db_clean()
+                if fields is None:
+                    self._cache.put(clazz, ID, obj)
+            objects.append(obj)
+        return objects
+
+    @_session
+    def load_objects(self, clazz, lazy=None, fields=None):
         # looking up a suitable mapper
         mapper = self.mappers[clazz]
-        # find group with the object id
-        parent_group = self._h5backend[mapper.group_name]
+        if mapper.storage_mode is StorageMode.TABLE:
+            return self._load_table_objects(clazz, self.list_ids(clazz), fields)
 
         objects = []
-        for ID in parent_group:
-            objects.append(self.load_object(clazz, ID))
+        for ID in self.list_ids(clazz):
+            objects.append(self.load_object(clazz, ID, lazy=lazy, fields=fields))
         return objects
 
+    def iter_objects(self, clazz, batch_size=None, lazy=None, fields=None):
+        """
+        Yields the objects of a class one by one in ID order, or as lists of up to *batch_size* objects. Objects are
+        read batch by batch and the objects read for a batch (including referenced ones) are dropped from the identity
+        map when the next batch is requested, so a class can be processed with bounded memory. See load_object for
+        *lazy* and *fields*.
+        """
+        mapper = self.mappers[clazz]
+        IDs = self.list_ids(clazz)
+        step = batch_size or 1
+        for start in range(0, len(IDs), step):
+            batch_IDs = IDs[start:start + step]
+            cached = set(self._cache.keys())
+            if mapper.storage_mode is StorageMode.TABLE:
+                batch = self._load_table_objects(clazz, batch_IDs, fields)
+            else:
+                batch = [self.load_object(clazz, ID, lazy=lazy, fields=fields) for ID in batch_IDs]
+            if batch_size is None:
+                yield batch[0]
+            else:
+                yield batch
+            for key in self._cache.keys():
+                if key not in cached:
+                    self._cache.invalidate(*key)
+
+    def list_ids(self, clazz):
+        """
+        Returns the IDs of all stored objects of a class, ordered by their number.
+        """
+        if self._catalog is not None:
+            return sorted(self._catalog.ids(self.mappers[clazz].group_name), key=H5DB._id_sort_key)
+        return self._scan_ids(clazz)
+
+    def count_objects(self, clazz):
+        """
+        Returns the number of stored objects of a class.
+        """
+        if self._catalog is not None:
+            return len(self._catalog.ids(self.mappers[clazz].group_name))
+        return len(self._scan_ids(clazz))
+
+    def list_objects(self, clazz=None):
+        """
+        Returns a pandas.DataFrame with the class name, the ID and the payload size in bytes (as of the last save or
+        update) of all stored objects, or of the objects of one class.
+        """
+        classes = [clazz] if clazz is not None else list(self.mappers)
+        rows = []
+        for clazz in classes:
+            class_name = self.mappers[clazz].group_name
+            for ID in self.list_ids(clazz):
+                size = self._catalog.size(class_name, ID) if self._catalog is not None else None
+                rows.append((class_name, ID, size))
+        return pandas.DataFrame(rows, columns=['class', 'ID', 'size'])
+
+    def _scan_ids(self, clazz):
+        # the IDs of a class read from its group or table
+        mapper = self.mappers[clazz]
+        if mapper.storage_mode is StorageMode.TABLE:
+            IDs = self._table(clazz).ids()
+        else:
+            IDs = list(self._h5backend[mapper.group_name])
+        return sorted(IDs, key=H5DB._id_sort_key)
+
+    def _id_sort_key(ID):
+        name, _, number = ID.rpartition('_')
+        return (name, int(number)) if number.isdigit() else (ID, -1)
+
+    def proxy(self, clazz, ID):
+        """
+        Returns the cached object with the given ID or an ObjectProxy that loads it on first access.
+        """
+        obj = self._cache.get(clazz, ID)
+        if obj is not None:
+            return obj
+        return ObjectProxy(self, clazz, ID)
+
+    def open_appender(self, obj, attr_name, buffer_size=1024):
+        """
+        Returns a DataFrameAppender for the DataFrame attribute *attr_name* of the saved object *obj*. The object is
+        dropped from the identity map, as its in-memory frame does not reflect the appended rows.
+        """
+        mapper = self.mappers[obj.__class__]
+        parent_group = self._h5backend[mapper.group_name][obj.ID]
+        group = parent_group[attr_name]
+        if 'h5db_content' in group.attrs:
+            # the frame is shared with other owners, the rows are appended to a private copy
+            key = group.attrs['h5db_content']
+            del parent_group[attr_name]
+            parent_group.copy(group, attr_name)
+            group = parent_group[attr_name]
+            del group.attrs['h5db_content']
+            self._release_content([key])
+        self._cache.invalidate(obj.__class__, obj.ID)
+        return DataFrameAppender(group, buffer_size)
+
+    @_session
+    def load_attribute(self, obj, attr_name, **options):
+        """
+        Reads a single attribute of a saved object from the file. The options are passed to the read function of the
+        attribute type, e.g. columns=[...] for DataFrame attributes.
+        """
+        mapper = self.mappers[obj.__class__]
+        if mapper.storage_mode is StorageMode.TABLE:
+            _, columns = self._table(obj.__class__).read([obj.ID])
+            return columns[attr_name][0]
+        attr_type = mapper.attribute_types[mapper.attributes.index(attr_name)]
+        options = dict(self._read_options.get(attr_type, {}), **options)
+        return attr_type.read(self._h5backend[mapper.group_name][obj.ID], attr_name, **options)
+
     def resolve_ref(self, h5ref):
         return self._h5backend[h5ref]
 
+    def resolve_reference(self, reference):
+        """
+        Returns the class and the ID of the object an object or region reference points to.
+        """
+        h5obj = self.resolve_ref(reference)
+        if not isinstance(reference, h5py.RegionReference) and self._catalog is not None:
+            entry = self._catalog.lookup(h5py.h5o.get_info(h5obj.id).addr)
+            if entry is not None:
+                return self.resolve_class_name(entry[0]), entry[1]
+        if isinstance(reference, h5py.RegionReference):
+            # a row of the ids dataset of an object table, the table is found by the address of the dataset, which is
+            # much faster than looking up the name of the dataset
+            address = h5py.h5o.get_info(h5obj.id).addr
+            if address not in self._table_addresses:
+                self._table_addresses = self._table_classes()
+            clazz = self._table_addresses.get(address)
+            if clazz is None:
+                clazz = self.resolve_class_name(h5obj.parent.name[1:])
+            (row,), _ = h5py.h5r.get_region(reference, h5obj.id).get_select_bounds()
+            return clazz, self._table(clazz).id_at(row)
+        clazz_name, ID = h5obj.name[1:].split('/')
+        return self.resolve_class_name(clazz_name), ID
+
+    def _table_classes(self):
+        table_classes = {}
+        for clazz, mapper in self.mappers.items():
+            if mapper.storage_mode is StorageMode.TABLE and 'ids' in self._h5backend[mapper.group_name]:
+                ids = self._h5backend[mapper.group_name]['ids']
+                table_classes[h5py.h5o.get_info(ids.id).addr] = clazz
+        return table_classes
+
+    def resolve_references(self, dataset):
+        """
+        Returns the classes and IDs of the objects referenced by a dataset of references. The references are read in
+        one pass and only the ones that have not been resolved before are dereferenced.
+        """
+        keys = _reference_keys(dataset)
+        targets = [self._references.get(key) for key in keys]
+        if None in targets and self._catalog is not None and h5py.check_dtype(ref=dataset.dtype) is h5py.Reference:
+            # object references hold the address of the object
+            for i, key in enumerate(keys):
+                entry = self._catalog.lookup(int.from_bytes(key, sys.byteorder)) if targets[i] is None else None
+                if entry is not None:
+                    targets[i] = (self.resolve_class_name(entry[0]), entry[1])
+        if None in targets:
+            refs = dataset[...].flat
+            for i, ref in enumerate(refs):
+                if targets[i] is None:
+                    targets[i] = self.resolve_reference(ref)
+                    self._references[keys[i]] = targets[i]
+        return targets
+
+    @_session
+    def resolve_objects(self, dataset):
+        """
+        Returns the objects referenced by a dataset of references (or their proxies while lazy loading). Objects of a
+        class that is stored as table are read together.
+        """
+        targets = self.resolve_references(dataset)
+        if self._lazy_loading:
+            return [self.proxy(clazz, ID) for clazz, ID in targets]
+        objects = {}
+        for clazz, ID in targets:
+            obj = self._cache.get(clazz, ID)
+            if obj is not None:
+                objects[(clazz, ID)] = obj
+        missing = collections.OrderedDict()
+        for clazz, ID in targets:
+            if (clazz, ID) not in objects:
+                missing.setdefault(clazz, collections.OrderedDict())[ID] = None
+        for clazz, IDs in missing.items():
+            if self.mappers[clazz].storage_mode is StorageMode.TABLE:
+                for obj in self._load_table_objects(clazz, list(IDs)):
+                    objects[(clazz, obj.ID)] = obj
+            else:
+                for ID in IDs:
+                    objects[(clazz, ID)] = self.load_object(clazz, ID)
+        return [objects[target] for target in targets]
+
     def resolve_class_name(self, class_name):
         return self.name_to_class[class_name]
 
 
+class H5DBReader():
+    """
+    Read access to the file of a H5DB that can be shared by threads and by the processes of a pool. Each thread of each
+    process opens its own H5DB read only on first use, handles that have been inherited by a fork are not used. The
+    reader can be pickled, if its factory can. Attribute access is forwarded to the H5DB of the calling thread, e.g.
+    reader.load_objects(TrainingResult).
+
+    :param factory: callable that returns a new, unopened H5DB, e.g. functools.partial(MeMoDB, 'results.h5')
+    :param swmr: open the file in SWMR read mode, to follow the rows a writer appends after start_swmr_write
+    """
+
+    def __init__(self, factory, swmr=False):
+        self._factory = factory
+        self._swmr = swmr
+        self._local = threading.local()
+
+    def db(self):
+        """
+        Returns the H5DB of the calling thread.
+        """
+        if getattr(self._local, 'pid', None) != os.getpid():
+            db = self._factory()
+            db.open(H5AccessMode.READ_EXISTING_FILE, swmr=self._swmr)
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return self._local.db
+
+    def refresh(self):
+        """
+        Drops the objects cached by the H5DB of the calling thread, so that they are read again with the rows that
+        have been appended in the meantime.
+        """
+        self.db().invalidate()
+
+    def close(self):
+        if getattr(self._local, 'pid', None) == os.getpid():
+            self._local.db.close()
+        self._local.db = None
+        self._local.pid = None
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.db(), name)
+
+    def __getstate__(self):
+        return {'_factory': self._factory, '_swmr': self._swmr}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+
+class WriterService():
+    """
+    Single writer for the file of a H5DB that is filled by many processes, e.g. parallel sampling workers. The service
+    runs in a dedicated process that owns the H5DB and listens on a local socket for the requests of WriterClients.
+    Requests that arrive while a group is being written are collected and committed together, the saved objects in one
+    batch and the appended rows with one flush per frame. Each client gets its answer after the group of its request
+    has been committed.
+
+    :param factory: callable that returns a new, unopened H5DB, e.g. functools.partial(MeMoDB, 'results.h5')
+    :param max_batch: maximum number of requests that are committed together
+    :param max_delay: seconds to wait for further requests after the first request of a group
+    :param buffer_size: buffer size of the appenders of the service
+    """
+
+    def __init__(self, factory, max_batch=256, max_delay=0.01, buffer_size=4096):
+        self._factory = factory
+        self._options = (max_batch, max_delay, buffer_size)
+        self._process = None
+        self.address = None
+
+    def start(self):
+        """
+        Starts the service process and waits until it accepts connections.
+        """
+        connection, child_connection = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=WriterService.serve,
+                                                args=(self._factory, child_connection) + self._options)
+        self._process.start()
+        started = connection.recv()
+        if isinstance(started, Exception):
+            self._process.join()
+            self._process = None
+            raise started
+        self.address = started
+
+    def client(self):
+        """
+        Returns a WriterClient for the service. It can be passed on to other processes.
+        """
+        return WriterClient(self.address)
+
+    def stop(self):
+        """
+        Commits the outstanding requests, closes the H5DB and ends the service process.
+        """
+        if self._process is None:
+            return
+        client = self.client()
+        client._request('stop')
+        client.close()
+        self._process.join()
+        self._process = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def serve(factory, connection, max_batch, max_delay, buffer_size):
+        try:
+            db = factory()
+            db.open()
+            listener = multiprocessing.connection.Listener()
+        except Exception as e:
+            connection.send(Exception('WriterService could not be started: %s' % (e)))
+            return
+        connection.send(listener.address)
+        requests = queue.Queue()
+        threading.Thread(target=WriterService.accept, args=(listener, requests), daemon=True).start()
+
+        appenders = {}
+        stopping = []
+        while not stopping:
+            # a group holds the requests that arrive within max_delay after its first request
+            group = [requests.get()]
+            deadline = time.monotonic() + max_delay
+            while len(group) < max_batch:
+                try:
+                    group.append(requests.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            stopping = [client for client, message in group if message[0] == 'stop']
+            WriterService.commit(db, appenders, buffer_size,
+                                 [(client, message) for client, message in group if message[0] != 'stop'])
+
+        listener.close()
+        for appender in appenders.values():
+            appender.close()
+        db.close()
+        for client in stopping:
+            client.send(('ok', None))
+
+    def accept(listener, requests):
+        while True:
+            try:
+                client = listener.accept()
+            except multiprocessing.AuthenticationError:
+                continue
+            except OSError:
+                return
+            threading.Thread(target=WriterService.receive, args=(client, requests), daemon=True).start()
+
+    def receive(client, requests):
+        try:
+            while True:
+                requests.put((client, client.recv()))
+        except (EOFError, OSError):
+            client.close()
+
+    def commit(db, appenders, buffer_size, group):
+        replies = WriterService.save(db, [(client, message) for client, message in group if message[0] == 'save'])
+        replies +=WriterService.append(db, appenders, buffer_size,
+                                        [(client, message) for client, message in group if message[0] == 'append'])
+        for client, reply in replies:
+            try:
+                client.send(reply)
+            except OSError:
+                pass
+
+    def save(db, requests):
+        try:
+            with db.batch():
+                for client, (_, objects) in requests:
+                    for obj in objects:
+                        db.save_object(obj)
+            return [(client, ('ok', [obj.ID for obj in objects])) for client, (_, objects) in requests]
+        except Exception:
+            pass
+        # the failed batch has been rolled back, its requests are written one by one so that only the faulty ones fail
+        replies = []
+        for client, (_, objects) in requests:
+            try:
+                db.save_objects(objects)
+                replies.append((client, ('ok', [obj.ID for obj in objects])))
+            except Exception as e:
+                replies.append((client, ('error', 'Objects could not be saved: %s' % (e))))
+        return replies
+
+    def append(db, appenders, buffer_size, requests):
+        replies = []
+        written = set()
+        for client, (_, clazz, ID, attr_name, rows) in requests:
+            try:
+                key = (clazz, ID, attr_name)
+                if key not in appenders:
+                    obj = db.load_object(clazz, ID, fields=[])
+                    appenders[key] = db.open_appender(obj, attr_name, buffer_size)
+                appender = appenders[key]
+                if hasattr(rows, 'columns'):
+                    appender.extend(rows)
+                else:
+                    for row in rows:
+                        appender.append(row)
+                written.add(key)
+                replies.append((client, ('ok', len(appender))))
+            except Exception as e:
+                replies.append((client, ('error', 'Rows could not be appended to %s of %s: %s' % (attr_name, ID, e))))
+        try:
+            for key in written:
+                appenders[key].flush()
+        except Exception as e:
+            return [(client, ('error', 'Rows could not be written: %s' % (e))) for client, _ in replies]
+        return replies
+
+
+class WriterClient():
+    """
+    Connection to a WriterService. Each thread of each process connects on first use, so a client can be handed to
+    the workers of a process pool. All calls block until the request has been committed by the service.
+    """
+
+    def __init__(self, address):
+        self.address = address
+        self._local = threading.local()
+
+    def save_object(self, obj):
+        """
+        Saves the object together with all referenced objects that have not been saved yet, sets and returns its ID.
+        Only the IDs of the given objects are sent back, referenced objects that are saved along keep ID None here.
+        """
+        return self.save_objects([obj])[0]
+
+    def save_objects(self, objects):
+        """
+        Saves several objects in one request, sets and returns their IDs.
+        """
+        objects = list(objects)
+        IDs = self._request('save', objects)
+        for obj, ID in zip(objects, IDs):
+            obj.ID = ID
+        return IDs
+
+    def append(self, obj, attr_name, rows):
+        """
+        Appends rows to the DataFrame attribute *attr_name* of the saved object *obj*. The rows are given as DataFrame
+        or as list of rows, see DataFrameAppender.append. Returns the number of rows of the stored frame.
+        """
+        return self._request('append', obj.__class__, obj.ID, attr_name, rows)
+
+    def close(self):
+        if getattr(self._local, 'pid', None) == os.getpid():
+            self._local.connection.close()
+        self._local.connection = None
+        self._local.pid = None
+
+    def _request(self, *message):
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.connection = multiprocessing.connection.Client(self.address)
+            self._local.pid = os.getpid()
+        self._local.connection.send(message)
+        status, value = self._local.connection.recv()
+        if status == 'error':
+            raise Exception(value)
+        return value
+
+    def __getstate__(self):
+        return {'address': self.address}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+
 class H5DBYAMLIntegrator():
 
     def __init__(self):
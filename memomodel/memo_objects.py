@@ -8,11 +8,13 @@ import pandas
 
 class SimConfig(h5db.H5DBObject, yaml.YAMLObject):
     yaml_tag = '!SimConfig'
+    h5db_deduplicate = True
     arguments = h5db.ObjectList
 
 
 class VirtualState(h5db.H5DBObject, yaml.YAMLObject):
     yaml_tag = '!VirtualState'
+    h5db_deduplicate = True
     name = h5db.Scalar
     update_attribute = h5db.Scalar
     init_attribute = h5db.Scalar
@@ -20,6 +22,7 @@ class VirtualState(h5db.H5DBObject, yaml.YAMLObject):
 
 class ModelStructure(h5db.H5DBObject, yaml.YAMLObject):
     yaml_tag = '!ModelStructure'
+    h5db_deduplicate = True
     simulator_parameters = h5db.List
     model_parameters = h5db.List
     model_inputs = h5db.List
@@ -29,6 +32,7 @@ class ModelStructure(h5db.H5DBObject, yaml.YAMLObject):
 
 class SamplerConfig(h5db.H5DBObject, yaml.YAMLObject):
     yaml_tag = '!SamplerConfig'
+    h5db_deduplicate = True
     name = h5db.Scalar
     strategy = h5db.Object
     sim_config = h5db.Object
@@ -38,6 +42,8 @@ class SamplerConfig(h5db.H5DBObject, yaml.YAMLObject):
 
 class ParameterVariation(h5db.H5DBObject, yaml.YAMLObject):
     yaml_tag = '!ParameterVariation'
+    h5db_deduplicate = True
+    h5db_indexes = ['parameter_name']
     parameter_name = h5db.Scalar
     variation_mode = h5db.Scalar
     variation_arguments = h5db.ObjectList
@@ -53,18 +59,21 @@ class ParameterVariationMode(enum.Enum):
 
 class StrategyConfig(h5db.H5DBObject, yaml.YAMLObject):
     yaml_tag = u'!StrategyConfig'
+    h5db_deduplicate = True
     name = h5db.Scalar
     arguments = h5db.ObjectList
 
 
 class KeyValuePair(h5db.H5DBObject, yaml.YAMLObject):
     yaml_tag = u'!KeyValuePair'
+    h5db_deduplicate = True
     key = h5db.Scalar
     value = h5db.Scalar
 
 
 class KeyListPair(h5db.H5DBObject, yaml.YAMLObject):
     yaml_tag = u'!KeyListPair'
+    h5db_deduplicate = True
     key = h5db.Scalar
     value = h5db.List
     #
@@ -72,12 +81,14 @@ class KeyListPair(h5db.H5DBObject, yaml.YAMLObject):
 
 class KeyObjectPair(h5db.H5DBObject, yaml.YAMLObject):
     yaml_tag = u'!KeyObjectPair'
+    h5db_deduplicate = True
     key = h5db.Scalar
     value = h5db.Object
 
 
 class ApproximationFunctionConfig(h5db.H5DBObject, yaml.YAMLObject):
     yaml_tag = '!ApproximationFunctionConfig'
+    h5db_deduplicate = True
     inputs = h5db.List
     outputs = h5db.List
     model_type = h5db.Scalar
@@ -88,6 +99,7 @@ class ApproximationFunctionConfig(h5db.H5DBObject, yaml.YAMLObject):
 
 class SurrogateModelConfig(h5db.H5DBObject, yaml.YAMLObject):
     yaml_tag = '!SurrogateModelConfig'
+    h5db_deduplicate = True
     name = h5db.Scalar
     approximation_functions = h5db.ObjectList
     sampler_configuration = h5db.Object
@@ -104,8 +116,14 @@ class DatasetOwnership(h5db.H5DBObject):
 
 
 class InputResponseDataset(h5db.H5DBObject):
+    # update marks the frames as changed, so unchanged (e.g. streamed) frames are not rewritten
+    h5db_mark_dirty = True
     inputs = h5db.DataFrame
     responses = h5db.DataFrame
+    # (input appender, response appender) while the dataset is streamed to a database, the number of stored rows after
+    # the stream has been closed
+    _h5db_appenders = None
+    _h5db_rows = None
 
     def __init__(self, input_cols=[], response_cols=[]):
         """
@@ -117,32 +135,101 @@ class InputResponseDataset(h5db.H5DBObject):
         self.responses = pandas.DataFrame(columns=response_cols, dtype=numpy.float64)
         h5db.H5DBObject.__init__(self)
 
+    def open_stream(self, db, buffer_size=1024, swmr=False):
+        """
+        Switches the dataset to streaming mode: it is saved to *db* if necessary and all following updates are appended
+        to the stored frames in blocks of *buffer_size* rows. The in-memory frames are set to None, load the dataset
+        from *db* after close_stream to access the data.
+
+        :param db: H5DB the dataset is stored in
+        :param buffer_size: number of rows that are buffered before they are written
+        :param swmr: switch *db* to SWMR mode, so that other processes can follow the written rows with tail
+        """
+        if self.ID is None:
+            db.save_object(self)
+        self._h5db_appenders = (db.open_appender(self, 'inputs', buffer_size),
+                           db.open_appender(self, 'responses', buffer_size))
+        # the frames are kept in the file, dropping them from memory is no change to be written by update_object
+        self.__dict__['inputs'] = None
+        self.__dict__['responses'] = None
+        if swmr:
+            db.start_swmr_write()
+
+    def close_stream(self):
+        """
+        Writes all buffered rows of a streamed dataset and ends the streaming mode.
+        """
+        for appender in self._h5db_appenders:
+            appender.close()
+        self._h5db_rows = len(self._h5db_appenders[0])
+        self._h5db_appenders = None
+
     def update(self, sample, response):
+        stripped_response = {key: values[0] for key,values in response.items()}
+        if self._h5db_appenders is not None:
+            input_appender, response_appender = self._h5db_appenders
+            input_appender.append(sample)
+            response_appender.append(stripped_response)
+            return
+        if self.inputs is None:
+            raise Exception('The frames of %s are only stored in the database, load it to update it' % (self.ID))
+
         next_idx = self.inputs.shape[0]
         # update inputs
         self.inputs.loc[next_idx,:] = sample
         # update responses
-        stripped_response = {key: values[0] for key,values in response.items()}
         self.responses.loc[next_idx, :] = stripped_response
+        self.mark_dirty('inputs', 'responses')
 
-    def select(self, selected_inputs=[], selected_responses=[]):
+    def select(self, selected_inputs=[], selected_responses=[], db=None):
+        """
+        Returns a new dataset with the selected columns. If the frames of a stored dataset are not held in memory
+        (after streaming or a projected load), only the selected columns are read from *db*.
+        """
         result = InputResponseDataset()
 
-        result.inputs = self.inputs[selected_inputs]
-        result.responses = self.responses[selected_responses]
+        if self.inputs is None:
+            result.inputs = db.load_attribute(self, 'inputs', columns=selected_inputs)
+        else:
+            result.inputs = self.inputs[selected_inputs]
+        if self.responses is None:
+            result.responses = db.load_attribute(self, 'responses', columns=selected_responses)
+        else:
+            result.responses = self.responses[selected_responses]
+        return result
+
+    def tail(self, db, start=0):
+        """
+        Returns a new dataset with the rows from *start* on that have been written to *db* so far. With a database
+        opened in SWMR read mode (e.g. a H5DBReader with swmr=True), this follows a dataset that another process
+        streams with open_stream(..., swmr=True).
+        """
+        result = InputResponseDataset()
+        inputs = db.load_attribute(self, 'inputs', start=start)
+        responses = db.load_attribute(self, 'responses', start=start)
+        # the frames are flushed one after the other, only complete rows are returned
+        length = min(len(inputs), len(responses))
+        result.inputs = inputs.iloc[:length]
+        result.responses = responses.iloc[:length]
         return result
 
     def __len__(self):
+        if self._h5db_appenders is not None:
+            return len(self._h5db_appenders[0])
+        if self.inputs is None:
+            if self._h5db_rows is None:
+                raise Exception('The frames of %s are only stored in the database, load it first' % (self.ID))
+            return self._h5db_rows
         return self.inputs.shape[0]
 
     def __repr__(self):
-        return str(self.__dict__)
+        return str(self.__getstate__())
 
 
 class TrainingResult(h5db.H5DBObject):
     train_data = h5db.Object
     test_data = h5db.Object
-    metamodel = h5db.Blob
+    metamodel = h5db.BufferedBlob
     score_r2 = h5db.Scalar
     score_avg = h5db.Scalar
     score_hae = h5db.Scalar
@@ -170,8 +257,9 @@ class SurrogateModelTrainingResult(h5db.H5DBObject):
 
 
 class SurrogateModel(h5db.H5DBObject):
+    h5db_indexes = ['name']
     name = h5db.Scalar
-    metamodels = h5db.Blob
+    metamodels = h5db.BufferedBlob
     model_structure = h5db.Object
 
     def __init__(self):
@@ -224,17 +312,17 @@ class KernelRidgeRegressionModelDescription(h5db.H5DBObject):
 
 
 class MeMoSimDB(h5db.H5DB):
-    def __init__(self, h5filename):
+    def __init__(self, h5filename, **kwargs):
         mapped_classes = [SimulationModelDescription, OLSModelDescription, GenericModelDescription, KernelRidgeRegressionModelDescription, ModelStructure, VirtualState]
-        h5db.H5DB.__init__(self, h5filename, mapped_classes)
+        h5db.H5DB.__init__(self, h5filename, mapped_classes, **kwargs)
 
 
 class MeMoDB(h5db.H5DB):
-    def __init__(self, h5filename):
+    def __init__(self, h5filename, **kwargs):
         mapped_classes = [SimConfig, ModelStructure, VirtualState, SamplerConfig, ParameterVariation,
                           StrategyConfig, KeyValuePair, SurrogateModelConfig, ApproximationFunctionConfig,
                           InputResponseDataset, TrainingResult, SurrogateModelTrainingResult, DatasetOwnership,
                           SurrogateModel]
-        h5db.H5DB.__init__(self, h5filename, mapped_classes)
+        h5db.H5DB.__init__(self, h5filename, mapped_classes, **kwargs)
 
         
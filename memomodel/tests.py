@@ -1,10 +1,25 @@
+import functools
+import os
+import pickle
+import tempfile
+import threading
+import numpy
 import pandas
 import yaml
 import h5db
 from h5db import H5DB
 
 from memomodel import SimConfig, VirtualState, ModelStructure, SamplerConfig, ParameterVariation, \
-    StrategyConfig, KeyValuePair, KeyObjectPair, ApproximationFunctionConfig, SurrogateModel, InputResponseDataset
+    StrategyConfig, KeyValuePair, KeyObjectPair, ApproximationFunctionConfig, SurrogateModel, InputResponseDataset, \
+    TrainingResult, OLSModelDescription
+
+
+class ScoreRow(h5db.H5DBObject):
+    h5db_storage = h5db.StorageMode.TABLE
+    h5db_indexes = ['name']
+    name = h5db.Scalar
+    score = h5db.Scalar
+    passed = h5db.Scalar
 
 
 def load_and_print_objects(db, clazz):
@@ -14,7 +29,7 @@ def load_and_print_objects(db, clazz):
 
 
 def test_save_sim_config():
-    db = H5DB('sim_configs.h5', [SimConfig, KeyValuePair])
+    db = H5DB('sim_configs.h5', [SimConfig, KeyValuePair], in_memory=True)
     db.open()
     obj = SimConfig()
     obj.arguments = [
@@ -42,7 +57,7 @@ def test_save_yaml_sim_config():
       - !KeyValuePair {key: cwd, value: .}
     """)
 
-    db = H5DB('yaml_sim_configs.h5', [SimConfig, KeyValuePair])
+    db = H5DB('yaml_sim_configs.h5', [SimConfig, KeyValuePair], in_memory=True)
     db.open()
     db.save_object(yaml_config)
     load_and_print_objects(db, SimConfig)
@@ -53,7 +68,7 @@ def test_save_yaml_sim_config():
 def test_save_model_structure():
     print('>>> test_save_model_structure')
 
-    db = H5DB('modelstructure_test.h5', [ModelStructure, VirtualState])
+    db = H5DB('modelstructure_test.h5', [ModelStructure, VirtualState], in_memory=True)
     db.open()
 
     model_structure = ModelStructure()
@@ -99,7 +114,7 @@ def test_save_yaml_model_structure():
     """)
     #print(yaml_config)
 
-    db = H5DB('yaml_modelstructure_test.h5', [ModelStructure, VirtualState])
+    db = H5DB('yaml_modelstructure_test.h5', [ModelStructure, VirtualState], in_memory=True)
     db.open()
     db.save_object(yaml_config)
     load_and_print_objects(db, ModelStructure)
@@ -108,7 +123,7 @@ def test_save_yaml_model_structure():
 
 
 def test_save_key_value_pair():
-    db = H5DB('keyvaluepair_test.h5', [KeyValuePair])
+    db = H5DB('keyvaluepair_test.h5', [KeyValuePair], in_memory=True)
     db.open()
 
     kvp = KeyValuePair()
@@ -122,7 +137,7 @@ def test_save_key_value_pair():
 
 def test_save_strategy_config():
     print('>>> test_save_strategy_config')
-    db = H5DB('strategy_test.h5', [StrategyConfig, KeyValuePair])
+    db = H5DB('strategy_test.h5', [StrategyConfig, KeyValuePair], in_memory=True)
     db.open()
 
     parameters = []
@@ -167,7 +182,7 @@ def test_save_yaml_strategy_config():
         name: examples strategie
     """)
 
-    db = H5DB('yaml_strategy_test.h5', [StrategyConfig, KeyValuePair])
+    db = H5DB('yaml_strategy_test.h5', [StrategyConfig, KeyValuePair], in_memory=True)
     db.open()
     db.save_object(yaml_config)
     load_and_print_objects(db, StrategyConfig)
@@ -177,7 +192,7 @@ def test_save_yaml_strategy_config():
 
 def test_save_parameter_variation():
     print('>>> test_save_parameter_variation')
-    db = H5DB('parameter_variation_test.h5', [ParameterVariation, KeyValuePair])
+    db = H5DB('parameter_variation_test.h5', [ParameterVariation, KeyValuePair], in_memory=True)
     db.open()
 
     step_size = KeyValuePair(key='value', value=60)
@@ -238,7 +253,7 @@ def test_save_yaml_parameter_variation():#
         variation_mode: constant
     """)
 
-    db = H5DB('yaml_parameter_variation_test.h5', [ParameterVariation, KeyValuePair])
+    db = H5DB('yaml_parameter_variation_test.h5', [ParameterVariation, KeyValuePair], in_memory=True)
     db.open()
 
     for parameter_variation in yaml_config:
@@ -250,7 +265,7 @@ def test_save_yaml_parameter_variation():#
 
 def test_save_sampling_result():
     print('>>> test_save_sampling_result')
-    db = H5DB('test_save_sampling_result.h5', [InputResponseDataset])
+    db = H5DB('test_save_sampling_result.h5', [InputResponseDataset], in_memory=True)
     db.open(access_mode=h5db.H5AccessMode.WRITE_TRUNCATE_ON_EXIST)
 
     sampling_result = InputResponseDataset()
@@ -271,21 +286,499 @@ def test_save_sampling_result():
     sampling_result.responses = pandas.DataFrame(response_data)
 
 
-    print(len(sampling_result))
-    print(sampling_result.inputs.dtypes)
+    assert len(sampling_result) == 10
 
     db.save_object(sampling_result)
 
-    print('##')
-    for sr in db.load_objects(InputResponseDataset):
-        print('==')
-        print(sr)
+    db.invalidate()
+    [sr] = db.load_objects(InputResponseDataset)
+    assert sr.inputs.equals(sampling_result.inputs) and sr.responses.equals(sampling_result.responses)
+    assert sr.inputs['col2'].dtype == sampling_result.inputs['col2'].dtype
 
     db.close()
     print('<<< test_save_sampling_result')
     pass
 
 
+def test_dataframe_columns():
+    print('>>> test_dataframe_columns')
+    db = H5DB('dataframe_test.h5', [InputResponseDataset], in_memory=True)
+    db.open(access_mode=h5db.H5AccessMode.WRITE_TRUNCATE_ON_EXIST)
+    inputs = pandas.DataFrame({
+        'count': numpy.arange(3),
+        'valid': [True, False, True],
+        'time': pandas.date_range('2020-01-01', periods=3, freq='h'),
+        'kind': pandas.Categorical(['pv', 'battery', 'pv']),
+        'name': ['a', 'bb', 'ccc'],
+        'args': [{'a': 1}, None, (1, 2)],
+    }, index=[10, 20, 30])
+    responses = pandas.DataFrame({'p': [0.5, 1.5, 2.5]},
+                                 index=pandas.MultiIndex.from_tuples([('a', 1), ('a', 2), ('b', 1)], names=['k', 'n']))
+    dataset = InputResponseDataset()
+    dataset.inputs = inputs
+    dataset.responses = responses
+    db.save_object(dataset)
+
+    db.invalidate()
+    stored = db.load_object(InputResponseDataset, dataset.ID)
+    # every column keeps its dtype
+    assert list(stored.inputs.dtypes) == list(inputs.dtypes)
+    assert stored.inputs.index.equals(inputs.index)
+    assert stored.inputs.drop(columns='args').equals(inputs.drop(columns='args'))
+    assert list(stored.inputs['args']) == [{'a': 1}, None, (1, 2)]
+    assert stored.responses.equals(responses) and stored.responses.index.names == ['k', 'n']
+
+    # single columns are read without the rest of the frame
+    selected = db.load_attribute(dataset, 'inputs', columns=['name', 'count'])
+    assert list(selected.columns) == ['name', 'count'] and list(selected['count']) == [0, 1, 2]
+    assert selected.index.equals(inputs.index)
+
+    # frames of earlier versions are stored as a single matrix
+    group = db._h5backend[db.mappers[InputResponseDataset].group_name][dataset.ID]
+    del group['responses']
+    matrix = group.create_dataset('responses', data=numpy.array([[1.0, 2.0], [3.0, 4.0]]))
+    matrix.attrs['index'] = numpy.array(['x', 'y'], dtype='S')
+    matrix.attrs['columns'] = numpy.array(['r1', 'r2'], dtype='S')
+    db.invalidate()
+    stored = db.load_object(InputResponseDataset, dataset.ID)
+    assert list(stored.responses.index) == ['x', 'y'] and list(stored.responses['r2']) == [2.0, 4.0]
+    assert list(db.load_attribute(dataset, 'responses', columns=['r2', 'r1']).iloc[0]) == [2.0, 1.0]
+    db.close()
+    print('<<< test_dataframe_columns')
+
+
+def test_stream_sampling_result():
+    print('>>> test_stream_sampling_result')
+    db = H5DB('test_stream_sampling_result.h5', [InputResponseDataset], in_memory=True)
+    db.open(access_mode=h5db.H5AccessMode.WRITE_TRUNCATE_ON_EXIST)
+
+    sampling_result = InputResponseDataset(input_cols=['col1', 'col2'], response_cols=['col1'])
+    sampling_result.open_stream(db, buffer_size=16)
+    for i in range(100):
+        sampling_result.update({'col1': i * 0.1, 'col2': i}, {'col1': [(i * 0.1)**2]})
+        if i == 50:
+            # the appenders are not part of the pickled state
+            assert pickle.loads(pickle.dumps(sampling_result)).ID == sampling_result.ID
+    sampling_result.close_stream()
+    assert len(sampling_result) == 100
+    assert '_h5db' not in repr(sampling_result)
+    try:
+        sampling_result.update({'col1': 0.0, 'col2': 0}, {'col1': [0.0]})
+        raise AssertionError('a closed stream has been updated')
+    except Exception as e:
+        assert 'only stored in the database' in str(e)
+
+    sr = db.load_object(InputResponseDataset, sampling_result.ID)
+    assert sr.inputs.shape == (100, 2) and sr.responses.shape == (100, 1)
+    assert list(sr.inputs['col2']) == list(range(100))
+    db.close()
+    print('<<< test_stream_sampling_result')
+
+
+def test_identity_map():
+    print('>>> test_identity_map')
+    db = H5DB('identity_map_test.h5', [StrategyConfig, KeyValuePair], cache=h5db.ObjectCache(max_objects=100),
+              in_memory=True)
+    db.open(access_mode=h5db.H5AccessMode.WRITE_TRUNCATE_ON_EXIST)
+
+    shared = KeyValuePair(key='num_samples', value=1000)
+    for name in ['lhs', 'full_factorial']:
+        strategy = StrategyConfig(name=name)
+        strategy.arguments = [shared]
+        db.save_object(strategy)
+
+    # drop the saved instances and read everything from the file again
+    db.invalidate()
+    strategies = db.load_objects(StrategyConfig)
+    assert strategies[0] is not strategies[1]
+    assert strategies[0].arguments[0] is strategies[1].arguments[0]
+    assert db.load_object(StrategyConfig, strategies[0].ID) is strategies[0]
+    db.close()
+    print('<<< test_identity_map')
+
+
+def test_query_parameter_variations():
+    print('>>> test_query_parameter_variations')
+    db = H5DB('query_test.h5', [ParameterVariation, KeyValuePair], in_memory=True)
+    db.open(access_mode=h5db.H5AccessMode.WRITE_TRUNCATE_ON_EXIST)
+
+    IDs = []
+    for name, mode in [('step_size', 'constant'), ('P_el_set', 'range_of_real_numbers'), ('SoC', 'constant')]:
+        variation = ParameterVariation(parameter_name=name, variation_mode=mode, variation_arguments=[])
+        db.save_object(variation)
+        IDs.append(variation.ID)
+
+    # parameter_name is indexed, variation_mode is compared dataset by dataset
+    assert [variation.ID for variation in db.find_by(ParameterVariation, 'parameter_name', 'SoC')] == [IDs[2]]
+    assert db.query(ParameterVariation).where(variation_mode='constant').order_by('parameter_name').ids() == \
+        [IDs[2], IDs[0]]
+    scanned = db.scan(ParameterVariation, ['parameter_name', 'variation_mode'])
+    assert list(scanned.index) == IDs
+    assert list(scanned['parameter_name']) == ['step_size', 'P_el_set', 'SoC']
+    assert list(scanned['variation_mode']) == ['constant', 'range_of_real_numbers', 'constant']
+    db.close()
+    print('<<< test_query_parameter_variations')
+
+
+def test_table_storage():
+    print('>>> test_table_storage')
+    db = H5DB('table_test.h5', [ScoreRow, KeyObjectPair], in_memory=True)
+    db.open(access_mode=h5db.H5AccessMode.WRITE_TRUNCATE_ON_EXIST)
+
+    rows = [ScoreRow(name='a', score=1, passed=False), ScoreRow(name='b', score=2.5, passed=True)]
+    db.save_objects(rows)
+    table = db._h5backend['ScoreRow/table']
+    assert table.dtype['score'] == numpy.float64 and table.dtype['passed'] == numpy.bool_
+    # the score column is widened to pickled values
+    db.save_object(ScoreRow(name='c', score='n/a', passed=False))
+    pair = KeyObjectPair(key='best', value=rows[1])
+    db.save_object(pair)
+
+    rows[0].score = 0.75
+    db.update_object(rows[0])
+    db.delete_object(ScoreRow, db.find_ids(ScoreRow, 'name', 'c')[0])
+    db.invalidate()
+
+    assert db.list_ids(ScoreRow) == [rows[0].ID, rows[1].ID]
+    assert [(row.name, row.score) for row in db.load_objects(ScoreRow)] == [('a', 0.75), ('b', 2.5)]
+    assert db.load_object(KeyObjectPair, pair.ID).value.ID == rows[1].ID
+    db.invalidate()
+    partial = db.load_object(ScoreRow, rows[0].ID, fields=['score'])
+    try:
+        db.update_object(partial)
+        raise AssertionError('a partially loaded row has been updated')
+    except Exception as e:
+        assert 'loaded partially' in str(e)
+    assert db.find_ids(ScoreRow, 'name', 'a') == [rows[0].ID]
+    db.close()
+    print('<<< test_table_storage')
+
+
+def test_order_by_mixed_values():
+    print('>>> test_order_by_mixed_values')
+    db = H5DB('order_test.h5', [KeyValuePair], in_memory=True)
+    db.open(access_mode=h5db.H5AccessMode.WRITE_TRUNCATE_ON_EXIST)
+    IDs = []
+    for value in [0.5, 'n/a', 0.9, 3]:
+        pair = KeyValuePair(key='score', value=value)
+        db.save_object(pair)
+        IDs.append(pair.ID)
+
+    # values that cannot be compared with the numbers come last
+    assert db.query(KeyValuePair).order_by('value').ids() == [IDs[0], IDs[2], IDs[3], IDs[1]]
+    assert db.query(KeyValuePair).order_by('value', descending=True).ids() == [IDs[3], IDs[2], IDs[0], IDs[1]]
+    db.close()
+    print('<<< test_order_by_mixed_values')
+
+
+def test_failed_save():
+    print('>>> test_failed_save')
+    db = H5DB('failed_save_test.h5', [StrategyConfig, KeyValuePair], in_memory=True)
+    db.open(access_mode=h5db.H5AccessMode.WRITE_TRUNCATE_ON_EXIST)
+
+    good = StrategyConfig(name='good', arguments=[KeyValuePair(key='a', value=1)])
+    bad = StrategyConfig(name='bad', arguments=[KeyValuePair(key='b', value=object())])
+    for save in [lambda: db.save_objects([good, bad]), lambda: db.save_object(bad)]:
+        try:
+            save()
+            raise AssertionError('saving an object without HDF5 type succeeded')
+        except TypeError:
+            pass
+        # nothing of the failed write is kept
+        assert good.ID is None and bad.ID is None and bad.arguments[0].ID is None
+        assert db.list_ids(StrategyConfig) == [] and list(db._h5backend['StrategyConfig']) == []
+
+    with db.batch():
+        db.save_object(good)
+        db.save_object(good)
+    assert db.list_ids(StrategyConfig) == [good.ID]
+    assert db.load_object(StrategyConfig, good.ID).arguments[0].value == 1
+    db.close()
+    print('<<< test_failed_save')
+
+
+def test_writer_service():
+    print('>>> test_writer_service')
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'writer_service_test.h5')
+        factory = functools.partial(H5DB, filename, [StrategyConfig, KeyValuePair, InputResponseDataset])
+        # requests that arrive within a second are committed together
+        with h5db.WriterService(factory, max_delay=1.0) as service:
+            client = service.client()
+            dataset = InputResponseDataset(input_cols=['a'], response_cols=['r'])
+            client.save_object(dataset)
+
+            good = StrategyConfig(name='good', arguments=[KeyValuePair(key='a', value=1)])
+            bad = StrategyConfig(name='bad', arguments=[KeyValuePair(key='b', value=object)])
+            errors = []
+
+            def save(obj):
+                try:
+                    client.save_object(obj)
+                except Exception as e:
+                    errors.append(e)
+            threads = [threading.Thread(target=save, args=(obj,)) for obj in [good, bad]]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            # only the faulty request of the group fails
+            assert good.ID is not None and bad.ID is None and len(errors) == 1
+
+            assert client.append(dataset, 'inputs', [{'a': 1.0}, {'a': 2.0}]) == 2
+            assert client.append(dataset, 'responses', pandas.DataFrame({'r': [0.5, 1.5]})) == 2
+            client.close()
+
+        db = factory()
+        db.open()
+        assert db.list_ids(StrategyConfig) == [good.ID]
+        assert db.load_object(StrategyConfig, good.ID).arguments[0].value == 1
+        stored = db.load_object(InputResponseDataset, dataset.ID)
+        assert list(stored.inputs['a']) == [1.0, 2.0] and list(stored.responses['r']) == [0.5, 1.5]
+        db.close()
+    print('<<< test_writer_service')
+
+
+def test_update_object():
+    print('>>> test_update_object')
+    db = H5DB('update_test.h5', [TrainingResult, InputResponseDataset, KeyValuePair], in_memory=True)
+    db.open(access_mode=h5db.H5AccessMode.WRITE_TRUNCATE_ON_EXIST)
+
+    result = TrainingResult()
+    result.train_data = InputResponseDataset(input_cols=['a'], response_cols=['r'])
+    result.test_data = InputResponseDataset(input_cols=['a'], response_cols=['r'])
+    result.score_r2 = 0.5
+    db.save_object(result)
+    result.train_data.open_stream(db, buffer_size=8)
+    for i in range(20):
+        result.train_data.update({'a': i}, {'r': [2.0 * i]})
+    result.train_data.close_stream()
+
+    # only the assigned attribute is written, the streamed dataset is left alone
+    result.score_r2 = 0.75
+    db.update_object(result)
+    db.invalidate()
+    stored = db.load_object(TrainingResult, result.ID)
+    assert stored.score_r2 == 0.75
+    assert stored.train_data.inputs.shape == (20, 1) and stored.train_data.responses.shape == (20, 1)
+
+    # a failing update keeps the stored value
+    stored.metamodel = lambda: None
+    try:
+        db.update_object(stored)
+        raise AssertionError('updating with an unpicklable value succeeded')
+    except Exception:
+        pass
+    db.invalidate()
+    assert db.load_object(TrainingResult, result.ID).metamodel is None
+
+    # a value of another type replaces the stored dataset instead of being converted to its type
+    pair = KeyValuePair(key='a', value=1.5)
+    db.save_object(pair)
+    pair.value = 7
+    db.update_object(pair)
+    db.invalidate()
+    value = db.load_object(KeyValuePair, pair.ID).value
+    assert value == 7 and not isinstance(value, float)
+    db.close()
+    print('<<< test_update_object')
+
+
+def test_update_partially_loaded():
+    print('>>> test_update_partially_loaded')
+    db = H5DB('partial_update_test.h5', [ParameterVariation, KeyValuePair], in_memory=True, deduplicate_objects=True)
+    db.open(access_mode=h5db.H5AccessMode.WRITE_TRUNCATE_ON_EXIST)
+
+    variation = ParameterVariation(parameter_name='SoC', variation_mode='constant', variation_arguments=[])
+    db.save_object(variation)
+    db.invalidate()
+    partial = db.load_object(ParameterVariation, variation.ID, fields=['variation_mode'])
+    assert partial.parameter_name is None
+    partial.variation_mode = 'range_of_real_numbers'
+    db.update_object(partial)
+
+    # the index and the structure key still know the attributes that have not been loaded
+    assert db.find_ids(ParameterVariation, 'parameter_name', 'SoC') == [variation.ID]
+    equal = ParameterVariation(parameter_name='SoC', variation_mode='range_of_real_numbers', variation_arguments=[])
+    db.save_object(equal)
+    assert equal.ID == variation.ID
+    db.close()
+    print('<<< test_update_partially_loaded')
+
+
+def test_update_in_place():
+    print('>>> test_update_in_place')
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'update_in_place_test.h5')
+        db = H5DB(path, [InputResponseDataset, SimConfig, KeyValuePair])
+        db.open()
+        dataset = InputResponseDataset(input_cols=['a'], response_cols=['r'])
+        config = SimConfig(arguments=[KeyValuePair(key='step_size', value=60)])
+        db.save_objects([dataset, config])
+
+        # values changed in place, without assignments
+        for i in range(5):
+            dataset.update({'a': float(i)}, {'r': [2.0 * i]})
+        config.arguments.append(KeyValuePair(key='steps', value=10))
+        db.update_object(dataset)
+        db.update_object(config)
+        db.close()
+
+        db = H5DB(path, [InputResponseDataset, SimConfig, KeyValuePair])
+        db.open()
+        stored = db.load_object(InputResponseDataset, dataset.ID)
+        assert list(stored.inputs['a']) == [0.0, 1.0, 2.0, 3.0, 4.0] and stored.responses.shape == (5, 1)
+        assert [argument.value for argument in db.load_object(SimConfig, config.ID).arguments] == [60, 10]
+        db.close()
+    print('<<< test_update_in_place')
+
+
+def test_catalog():
+    print('>>> test_catalog')
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'catalog_test.h5')
+        db = H5DB(filename, [SimConfig, KeyValuePair])
+        db.open()
+        config = SimConfig(arguments=[KeyValuePair(key='num_samples', value=1000)])
+        db.save_object(config)
+        # files written without catalog get one when they are opened for writing
+        del db._h5backend['__h5db__/catalog']
+        db.close()
+
+        db = H5DB(filename, [KeyValuePair])
+        db.open()
+        assert db.count_objects(KeyValuePair) == 1
+        db.close()
+
+        # the classes that have not been mapped by the first writer are catalogued later on
+        for access_mode in [h5db.H5AccessMode.READ_EXISTING_FILE, h5db.H5AccessMode.DEFAULT]:
+            db = H5DB(filename, [SimConfig, KeyValuePair])
+            db.open(access_mode)
+            assert db.list_ids(SimConfig) == [config.ID]
+            assert list(db.list_objects()['ID']) == [config.ID, config.arguments[0].ID]
+            assert db.load_objects(SimConfig)[0].arguments[0].value == 1000
+            db.close()
+    print('<<< test_catalog')
+
+
+def test_iter_objects():
+    print('>>> test_iter_objects')
+    db = H5DB('iter_test.h5', [TrainingResult, InputResponseDataset], in_memory=True)
+    db.open(access_mode=h5db.H5AccessMode.WRITE_TRUNCATE_ON_EXIST)
+    for i in range(10):
+        result = TrainingResult()
+        result.train_data = InputResponseDataset(input_cols=['a'], response_cols=['r'])
+        result.test_data = result.train_data
+        result.score_r2 = i / 10
+        db.save_object(result)
+    db.invalidate()
+
+    scores = []
+    for batch in db.iter_objects(TrainingResult, batch_size=3):
+        assert all(result.train_data is result.test_data for result in batch)
+        scores.extend(result.score_r2 for result in batch)
+        # only the current batch is held in the identity map
+        assert len(db._cache) == 2 * len(batch)
+    assert scores == [i / 10 for i in range(10)]
+    assert len(db._cache) == 0
+    db.close()
+    print('<<< test_iter_objects')
+
+
+def test_content_store():
+    print('>>> test_content_store')
+    db = H5DB('content_test.h5', [OLSModelDescription, InputResponseDataset], in_memory=True, deduplicate=True)
+    db.open(access_mode=h5db.H5AccessMode.WRITE_TRUNCATE_ON_EXIST)
+
+    def payloads():
+        return len(db._h5backend.require_group('__h5db__/content'))
+
+    first = OLSModelDescription(intercept=numpy.zeros(2), coefs=numpy.eye(2))
+    second = OLSModelDescription(intercept=numpy.ones(2), coefs=numpy.eye(2))
+    db.save_objects([first, second])
+    # both owners link the same payload
+    assert payloads() == 1
+
+    # updating a shared payload leaves the other owner unchanged
+    first.coefs = numpy.full((2, 2), 3.0)
+    db.update_object(first)
+    assert payloads() == 2
+    db.invalidate()
+    assert (db.load_object(OLSModelDescription, first.ID).coefs == 3.0).all()
+    assert (db.load_object(OLSModelDescription, second.ID).coefs == numpy.eye(2)).all()
+
+    # the payload is released with its last owner
+    third = OLSModelDescription(intercept=numpy.zeros(2), coefs=numpy.eye(2))
+    db.save_object(third)
+    assert payloads() == 2
+    db.delete_object(OLSModelDescription, second.ID)
+    assert payloads() == 2
+    db.invalidate()
+    assert (db.load_object(OLSModelDescription, third.ID).coefs == numpy.eye(2)).all()
+    db.delete_object(OLSModelDescription, third.ID)
+    assert payloads() == 1
+    db.delete_object(OLSModelDescription, first.ID)
+    assert payloads() == 0
+
+    # rows are appended to a private copy of a shared frame
+    datasets = [InputResponseDataset(input_cols=['a'], response_cols=['r']) for _ in range(2)]
+    db.save_objects(datasets)
+    assert payloads() == 2
+    appender = db.open_appender(datasets[0], 'inputs')
+    appender.append({'a': 1.0})
+    appender.close()
+    assert payloads() == 2
+    db.invalidate()
+    assert list(db.load_object(InputResponseDataset, datasets[0].ID).inputs['a']) == [1.0]
+    assert len(db.load_object(InputResponseDataset, datasets[1].ID).inputs) == 0
+    db.close()
+    print('<<< test_content_store')
+
+
+def test_id_allocation():
+    print('>>> test_id_allocation')
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'id_allocation_test.h5')
+        db = H5DB(filename, [KeyValuePair])
+        db.open()
+        group = db._h5backend[db.mappers[KeyValuePair].group_name]
+        pairs = [KeyValuePair(key='k%d' % i, value=i) for i in range(3)]
+        db.save_objects(pairs)
+        # a block of numbers is reserved in the file, not every single one
+        assert group.attrs['next_id'] == 3 + 1024
+        IDs = [pair.ID for pair in pairs]
+
+        # the numbers of deleted objects are not handed out again
+        db.delete_object(KeyValuePair, IDs[-1])
+        pair = KeyValuePair(key='k3', value=3)
+        db.save_object(pair)
+        IDs.append(pair.ID)
+        IDs += db.reserve_ids(KeyValuePair, 2000)
+        # the unused rest of the block is given back on close
+        db.close()
+        db.open()
+        group = db._h5backend[db.mappers[KeyValuePair].group_name]
+        assert group.attrs['next_id'] == 2004
+        db.delete_object(KeyValuePair, IDs[3])
+        pair = KeyValuePair(key='k4', value=4)
+        db.save_object(pair)
+        IDs.append(pair.ID)
+        db.close()
+
+        # files without counter continue after the highest stored number
+        db.open()
+        del db._h5backend[db.mappers[KeyValuePair].group_name].attrs['next_id']
+        db.close()
+        db.open()
+        pair = KeyValuePair(key='k5', value=5)
+        db.save_object(pair)
+        IDs.append(pair.ID)
+        db.close()
+        assert len(set(IDs)) == len(IDs)
+        assert sorted(IDs, key=H5DB._id_sort_key) == IDs
+    print('<<< test_id_allocation')
+
+
 def battery_sim():
     print('>>> battery_sim')
     db = H5DB('batterysimtest.h5', [SimConfig, ModelStructure, VirtualState, SamplerConfig, ParameterVariation,
@@ -647,6 +1140,22 @@ if __name__=='__main__':
     #test_save_yaml_parameter_variation()
 
     test_save_sampling_result()
+    test_dataframe_columns()
+
+    test_stream_sampling_result()
+    test_identity_map()
+    test_query_parameter_variations()
+    test_table_storage()
+    test_order_by_mixed_values()
+    test_failed_save()
+    test_writer_service()
+    test_update_object()
+    test_update_partially_loaded()
+    test_update_in_place()
+    test_catalog()
+    test_iter_objects()
+    test_content_store()
+    test_id_allocation()
 
     #battery_sim()
     #yaml_battery_sim()
\ No newline at end of file